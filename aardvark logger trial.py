@@ -118,7 +118,7 @@ def main():
         all_instances = create_instances(addvark_list)
         df = build_df(all_instances)
         sleeptime = 10.0
-        l = task.LoopingCall(run_tlm_log(df, all_instances))
+        l = task.LoopingCall(run_tlm_log, df, all_instances)
         l.start(sleeptime)
         while True:
             try:
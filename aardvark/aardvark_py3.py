@@ -55,17 +55,93 @@ AA_REQ_SW_VERSION = 0x050a   # v5.10
 
 import os
 import sys
+import threading
 import ctypes as c
 
 from array import array, ArrayType
 import struct
 
-api = c.cdll.LoadLibrary('aardvark.dll')
-if not api:
-    print('Unable to load aardvark.dll')
-    exit(0)
-else:
+class AardvarkLibraryError(OSError):
+    pass
+
+# Argument and return types of the native entry points, bound once when
+# the library is loaded.  Buffers are passed as void pointers so ctypes
+# arrays, pointers to them, byref() results and bytes are all accepted.
+_PROTOTYPES = {
+    'c_aa_find_devices_ext': (c.c_int, [c.c_int, c.c_void_p, c.c_int, c.c_void_p]),
+    'c_aa_open':             (c.c_int, [c.c_int]),
+    'c_aa_close':            (c.c_int, [c.c_int]),
+    'c_aa_i2c_bitrate':      (c.c_int, [c.c_int, c.c_int]),
+    'c_aa_i2c_pullup':       (c.c_int, [c.c_int, c.c_uint8]),
+    'c_aa_target_power':     (c.c_int, [c.c_int, c.c_uint8]),
+    'c_aa_i2c_read':         (c.c_int, [c.c_int, c.c_uint16, c.c_int, c.c_uint16,
+                                        c.c_void_p]),
+    'c_aa_i2c_write':        (c.c_int, [c.c_int, c.c_uint16, c.c_int, c.c_uint16,
+                                        c.c_void_p]),
+    'c_aa_i2c_write_read':   (c.c_int, [c.c_int, c.c_uint16, c.c_int, c.c_uint16,
+                                        c.c_void_p, c.c_void_p, c.c_uint16,
+                                        c.c_void_p, c.c_void_p]),
+    'c_aa_sleep_ms':         (c.c_uint32, [c.c_uint32]),
+}
+
+# AARDVARK_LIBRARY names the native library explicitly; otherwise the
+# platform's aardvark.dll or aardvark.so is used, preferring a copy next
+# to this module.
+def aa_library_path ():
+    override = os.environ.get('AARDVARK_LIBRARY')
+    if override:
+        return override
+    name = 'aardvark.dll' if sys.platform.startswith('win') else 'aardvark.so'
+    local = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    return local if os.path.exists(local) else name
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# AARDVARK_BACKEND=sim swaps the native library for the simulator in
+# aardvark/simulator.py, so the tooling runs without an adapter attached.
+def _load_backend ():
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            return _backend
+        if os.environ.get('AARDVARK_BACKEND', 'native') == 'sim':
+            from .simulator import SimulatedAardvarkApi
+            _backend = SimulatedAardvarkApi.from_environment()
+            return _backend
+        path = aa_library_path()
+        try:
+            library = c.CDLL(path)
+        except OSError as e:
+            raise AardvarkLibraryError('Unable to load %s: %s' % (path, e))
+        for name, (restype, argtypes) in _PROTOTYPES.items():
+            function = getattr(library, name, None)
+            if function is not None:
+                function.restype = restype
+                function.argtypes = argtypes
+        _backend = library
+        return _backend
+
+class _LazyApi(object):
+    # Loads the backend on the first aa_* call rather than at import, and
+    # caches each entry point on itself so later lookups are plain
+    # attribute hits.
+    def __getattr__(self, name):
+        function = getattr(_load_backend(), name)
+        setattr(self, name, function)
+        return function
+
+api = _LazyApi()
+# The library is loaded on first use; failures raise AardvarkLibraryError.
+AA_LIBRARY_LOADED = True
+
+# Replace the backend behind the aa_* functions, e.g. with a configured
+# SimulatedAardvarkApi.  Returns the previous backend.
+def aa_set_backend (backend):
+    global api, AA_LIBRARY_LOADED
+    previous, api = api, backend
     AA_LIBRARY_LOADED = True
+    return previous
 
 #==========================================================================
 # HELPER FUNCTIONS
@@ -103,6 +179,12 @@ def array_s64 (p, n):  return array('L', [x for x in p.contents[:n]])
 def array_f32 (p, n):  return array('f', [x for x in p.contents[:n]])
 def array_f64 (p, n):  return array('d', [x for x in p.contents[:n]])
 
+# View a caller-owned u08 buffer (bytearray, array('B'), memoryview, NumPy
+# uint8 array or a ctypes u08 array) as a ctypes array without copying.
+def buffer_u08 (b):
+    if isinstance(b, c.Array):  return b
+    return (c.c_uint8*memoryview(b).nbytes).from_buffer(b)
+
 #==========================================================================
 # STATUS CODES
 #==========================================================================
@@ -290,6 +372,82 @@ def aa_i2c_write (aardvark, slave_addr, flags, data_out):
     # Call API function
     return api.c_aa_i2c_write(aardvark, slave_addr, flags, num_bytes, p_data_out)
 
+# Clamp a caller's n_bytes to the buffer, so the library never reads or
+# writes past the end of caller memory.
+def _clamp_bytes (buffer, n_bytes):
+    if n_bytes is None: return len(buffer)
+    return max(0, min(len(buffer), n_bytes))
+
+# Read into a caller-owned buffer instead of allocating a new array.
+def aa_i2c_read_into (aardvark, slave_addr, flags, data_in, n_bytes=None):
+    """usage: int return = aa_i2c_read_into(Aardvark aardvark, u16 slave_addr, AardvarkI2cFlags flags, u08[] data_in, int n_bytes=None)
+
+    data_in must be a writable buffer (bytearray, array('B'), memoryview,
+    NumPy uint8 array or ctypes u08 array); it is filled in place and is
+    not copied.  If n_bytes is omitted the whole buffer is requested; it
+    is clamped to the buffer length.  Returns the number of bytes read."""
+
+    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    p_data_in = buffer_u08(data_in)
+    n_bytes = _clamp_bytes(p_data_in, n_bytes)
+    # Call API function
+    return api.c_aa_i2c_read(aardvark, slave_addr, flags, n_bytes, p_data_in)
+
+# Write from a caller-owned buffer without per-byte conversion.
+def aa_i2c_write_from (aardvark, slave_addr, flags, data_out, n_bytes=None):
+    """usage: int return = aa_i2c_write_from(Aardvark aardvark, u16 slave_addr, AardvarkI2cFlags flags, u08[] data_out, int n_bytes=None)
+
+    data_out may be bytes or any buffer accepted by aa_i2c_read_into;
+    bytes are passed straight through and writable buffers are viewed in
+    place.  If n_bytes is omitted the whole buffer is written; it is
+    clamped to the buffer length."""
+
+    if not AA_LIBRARY_LOADED: return AA_INCOMPATIBLE_LIBRARY
+    if isinstance(data_out, bytes):
+        p_data_out = data_out
+    else:
+        p_data_out = buffer_u08(data_out)
+    n_bytes = _clamp_bytes(p_data_out, n_bytes)
+    # Call API function
+    return api.c_aa_i2c_write(aardvark, slave_addr, flags, n_bytes, p_data_out)
+
+# Write then read with a repeated start (combined format) between them.
+#
+# Uses the library's native aa_i2c_write_read when it provides one, which
+# costs a single USB round trip.  Older libraries fall back to a write
+# with AA_I2C_NO_STOP followed immediately by the read.
+def aa_i2c_write_read_into (aardvark, slave_addr, flags, data_out, data_in, n_bytes=None):
+    """usage: (int return, int num_written, int num_read) = aa_i2c_write_read_into(Aardvark aardvark, u16 slave_addr, AardvarkI2cFlags flags, u08[] data_out, u08[] data_in, int n_bytes=None)
+
+    data_out and data_in follow aa_i2c_write_from and aa_i2c_read_into.
+    return is the status of the combined call (0 on success)."""
+
+    if not AA_LIBRARY_LOADED: return (AA_INCOMPATIBLE_LIBRARY, 0, 0)
+    p_data_in = buffer_u08(data_in)
+    n_bytes = _clamp_bytes(p_data_in, n_bytes)
+    if isinstance(data_out, bytes):
+        p_data_out = data_out
+    else:
+        p_data_out = buffer_u08(data_out)
+    out_num_bytes = len(p_data_out)
+
+    if hasattr(api, 'c_aa_i2c_write_read'):
+        num_written = c.c_uint16()
+        num_read = c.c_uint16()
+        (_ret_) = api.c_aa_i2c_write_read(aardvark, slave_addr, flags,
+                                          out_num_bytes, p_data_out, c.byref(num_written),
+                                          n_bytes, p_data_in, c.byref(num_read))
+        return (_ret_, num_written.value, num_read.value)
+
+    num_written = api.c_aa_i2c_write(aardvark, slave_addr, flags | AA_I2C_NO_STOP,
+                                     out_num_bytes, p_data_out)
+    if num_written < 0:
+        return (num_written, 0, 0)
+    num_read = api.c_aa_i2c_read(aardvark, slave_addr, flags, n_bytes, p_data_in)
+    if num_read < 0:
+        return (num_read, num_written, 0)
+    return (AA_OK, num_written, num_read)
+
 # Sleep for the specified number of milliseconds
 # Accuracy depends on the operating system scheduler
 # Returns the number of milliseconds slept
@@ -0,0 +1,73 @@
+import json
+import math
+import os
+
+from .wrapper import AardvarkI2CWriteRead
+
+def calibration_key(transaction):
+    return '%s@0x%02X/fw %s' % (transaction.device or '', transaction.address,
+                                transaction.firmware or 'unknown')
+
+def command_key(transaction):
+    return '0x%02X:0x%04X' % (transaction.cmd, transaction.data)
+
+def _reads_ok(handle, transaction, delay, samples):
+    trial = transaction.replace(delay=delay)
+    for _ in range(samples):
+        data_read, bytes_read, bytes_written = AardvarkI2CWriteRead(handle, trial)
+        if bytes_read != transaction.bytes_to_read:
+            return False
+    return True
+
+def calibrate_transaction(handle, transaction, samples=3, margin=1.5, guard_ms=2):
+    """Find the shortest settle delay (ms) that still gives complete reads.
+
+    Binary searches between 0 and the transaction's configured delay; a
+    delay passes when `samples` reads in a row return every byte. The
+    result is scaled by `margin` plus `guard_ms` and capped at the
+    configured delay.
+    """
+    high = transaction.delay
+    if not _reads_ok(handle, transaction, high, samples):
+        return high
+    low = -1
+    while high - low > 1:
+        mid = (low + high) // 2
+        if _reads_ok(handle, transaction, mid, samples):
+            high = mid
+        else:
+            low = mid
+    return min(transaction.delay, int(math.ceil(high * margin)) + guard_ms)
+
+def calibrate(handle, transactions, cache=None, **kwargs):
+    cache = cache if cache is not None else {}
+    for transaction in transactions:
+        if not transaction.bytes_to_read:
+            continue
+        delays = cache.setdefault(calibration_key(transaction), {})
+        delays[command_key(transaction)] = calibrate_transaction(handle, transaction, **kwargs)
+    return cache
+
+def load_calibration(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_calibration(path, cache):
+    with open(path, 'w') as f:
+        json.dump(cache, f, indent=4, sort_keys=True)
+
+def apply_calibration(transactions, cache):
+    """Return transactions using calibrated delays where the cache has them.
+
+    The configured delay is kept as 'fallback_delay' so a short read can
+    be retried at the original worst-case setting.
+    """
+    calibrated = []
+    for transaction in transactions:
+        delay = cache.get(calibration_key(transaction), {}).get(command_key(transaction))
+        if delay is not None and delay < transaction.delay:
+            transaction = transaction.replace(delay=delay, fallback_delay=transaction.delay)
+        calibrated.append(transaction)
+    return calibrated
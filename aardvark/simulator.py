@@ -0,0 +1,242 @@
+import json
+import os
+import random
+import time
+import ctypes as c
+
+AA_OK = 0
+AA_UNABLE_TO_OPEN = -7
+AA_INVALID_HANDLE = -9
+AA_PORT_NOT_FREE = 0x8000
+
+def _contents(buffer):
+    if isinstance(buffer, c._Pointer):
+        return buffer.contents
+    if hasattr(buffer, '_obj'):   # c.byref()
+        return buffer._obj
+    return buffer
+
+def _bytes_of(buffer, n_bytes):
+    return bytes(_contents(buffer))[:n_bytes]
+
+def _fill(buffer, data):
+    buffer = _contents(buffer)
+    for i, byte in enumerate(data):
+        buffer[i] = byte
+
+def _register_value(code):
+    # Deterministic, plausible-looking 12-bit ADC reading per TLE code.
+    return (code * 2654435761 >> 8) & 0x0FFF
+
+class SimulatedDevice():
+    """An I2C slave answering telemetry requests like the EPS.
+
+    A write of [cmd, code_hi, code_lo] selects a register; the reply is
+    ready `settle_ms` later, and a read issued before then is NACKed
+    (returns 0 bytes). `registers` maps TLE code to the value returned,
+    big-endian in as many bytes as are read; unknown codes read as 0xFFFF.
+    """
+
+    def __init__(self, address, registers, settle_ms=5.0, nack_rate=0.0):
+        self.address = address
+        self.registers = dict(registers)
+        self.settle_ms = settle_ms
+        self.nack_rate = nack_rate
+        self.pending = None
+        self.ready_at = 0.0
+
+class SimulatedAdapter():
+    def __init__(self, unique_id, devices):
+        self.unique_id = unique_id
+        self.devices = {device.address: device for device in devices}
+        self.handle = None
+
+def devices_from_config(config, settle_ms=5.0, nack_rate=0.0, values=None):
+    """Build SimulatedDevices from a thermallogger device config file or dict."""
+    if not isinstance(config, dict):
+        with open(config) as f:
+            config = json.load(f)
+    values = values or {}
+    devices = []
+    for name, device in config['devices'].items():
+        registers = {}
+        for tlm, entry in device['TLE codes'].items():
+            code = int(entry['code'] if isinstance(entry, dict) else entry, 16)
+            registers[code] = values.get(tlm, _register_value(code))
+        devices.append(SimulatedDevice(int(device['Address'], 16), registers,
+                                       settle_ms, nack_rate))
+    return devices
+
+class SimulatedAardvarkApi():
+    """Stand-in for the native Aardvark library behind the aa_* functions.
+
+    Exposes the c_aa_* entry points aardvark_py3 calls, with the same
+    arguments. Every call costs `usb_latency_ms` of host time, as a USB
+    round trip would; settle times and NACKs follow SimulatedDevice.
+    Random NACKs come from a seeded generator, so a run is repeatable.
+    `sleep` and `clock` can be replaced to run against a virtual clock.
+    """
+
+    def __init__(self, adapters, usb_latency_ms=1.0, seed=0, write_read=True,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.adapters = list(adapters)
+        self.usb_latency_ms = usb_latency_ms
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._sleep = sleep
+        self._clock = clock
+        self._handles = {}
+        self._next_handle = 1
+        if write_read:
+            # Without it aa_i2c_write_read_into falls back to a write with
+            # NO_STOP and a read, as it does on older libraries.
+            self.c_aa_i2c_write_read = self._write_read
+
+    @classmethod
+    def from_environment(cls, environ=os.environ):
+        """Build a simulator from AARDVARK_SIM_* environment variables.
+
+        AARDVARK_SIM_CONFIG    device config path(s), os.pathsep separated,
+                               one adapter each (default 'eps thermal config.json')
+        AARDVARK_SIM_ADAPTERS  number of adapters, cycling through the configs
+        AARDVARK_SIM_USB_MS    USB round trip per call (default 1)
+        AARDVARK_SIM_SETTLE_MS device settle time (default 5)
+        AARDVARK_SIM_NACK_RATE probability of a spurious NACK (default 0)
+        AARDVARK_SIM_SEED      random seed (default 0)
+        """
+        configs = environ.get('AARDVARK_SIM_CONFIG', 'eps thermal config.json').split(os.pathsep)
+        count = int(environ.get('AARDVARK_SIM_ADAPTERS', len(configs)))
+        settle_ms = float(environ.get('AARDVARK_SIM_SETTLE_MS', 5.0))
+        nack_rate = float(environ.get('AARDVARK_SIM_NACK_RATE', 0.0))
+        adapters = [SimulatedAdapter(2237000000 + i,
+                                     devices_from_config(configs[i % len(configs)],
+                                                         settle_ms, nack_rate))
+                    for i in range(count)]
+        return cls(adapters, usb_latency_ms=float(environ.get('AARDVARK_SIM_USB_MS', 1.0)),
+                   seed=int(environ.get('AARDVARK_SIM_SEED', 0)))
+
+    def unplug(self, unique_id):
+        """Pull an adapter out: it leaves the device list and its open
+        handle stops working. Returns it, so it can be plugged back in."""
+        for adapter in self.adapters:
+            if adapter.unique_id == unique_id:
+                self.adapters.remove(adapter)
+                self._handles.pop(adapter.handle, None)
+                adapter.handle = None
+                return adapter
+        raise KeyError(unique_id)
+
+    def plug(self, adapter):
+        self.adapters.append(adapter)
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.usb_latency_ms:
+            self._sleep(self.usb_latency_ms / 1000.0)
+
+    def _device(self, handle, slave_addr):
+        adapter = self._handles.get(handle)
+        if adapter is None:
+            return None
+        return adapter.devices.get(slave_addr)
+
+    def _nack(self, device):
+        return device.nack_rate and self._random.random() < device.nack_rate
+
+    def _select(self, device, data):
+        if len(data) >= 3:
+            device.pending = int.from_bytes(data[1:3], 'big')
+        device.ready_at = self._clock() + device.settle_ms / 1000.0
+
+    def _reply(self, device, n_bytes):
+        value = device.registers.get(device.pending, 0xFFFF)
+        return value.to_bytes(8, 'big', signed=value < 0)[-n_bytes:] if n_bytes else b''
+
+    # General API
+
+    def c_aa_find_devices_ext(self, num_devices, devices, num_ids, unique_ids):
+        self._round_trip()
+        for port, adapter in enumerate(self.adapters[:min(num_devices, num_ids)]):
+            _contents(devices)[port] = port | (AA_PORT_NOT_FREE if adapter.handle else 0)
+            _contents(unique_ids)[port] = adapter.unique_id
+        return len(self.adapters)
+
+    def c_aa_open(self, port_number):
+        self._round_trip()
+        if not 0 <= port_number < len(self.adapters):
+            return AA_UNABLE_TO_OPEN
+        adapter = self.adapters[port_number]
+        if adapter.handle:
+            return AA_UNABLE_TO_OPEN
+        adapter.handle = self._next_handle
+        self._next_handle += 1
+        self._handles[adapter.handle] = adapter
+        return adapter.handle
+
+    def c_aa_close(self, aardvark):
+        adapter = self._handles.pop(aardvark, None)
+        if adapter is None:
+            return 0
+        adapter.handle = None
+        return 1
+
+    def c_aa_i2c_bitrate(self, aardvark, bitrate_khz):
+        self._round_trip()
+        return bitrate_khz or 100
+
+    def c_aa_i2c_pullup(self, aardvark, pullup_mask):
+        self._round_trip()
+        return pullup_mask & 0x03
+
+    def c_aa_target_power(self, aardvark, power_mask):
+        self._round_trip()
+        return power_mask & 0x03
+
+    def c_aa_sleep_ms(self, milliseconds):
+        self._sleep(milliseconds / 1000.0)
+        return milliseconds
+
+    # I2C API
+
+    def c_aa_i2c_write(self, aardvark, slave_addr, flags, num_bytes, data_out):
+        self._round_trip()
+        if aardvark not in self._handles:
+            return AA_INVALID_HANDLE
+        device = self._device(aardvark, slave_addr)
+        if device is None or self._nack(device):
+            return 0
+        self._select(device, _bytes_of(data_out, num_bytes))
+        return num_bytes
+
+    def c_aa_i2c_read(self, aardvark, slave_addr, flags, num_bytes, data_in):
+        self._round_trip()
+        if aardvark not in self._handles:
+            return AA_INVALID_HANDLE
+        device = self._device(aardvark, slave_addr)
+        if device is None or self._clock() < device.ready_at or self._nack(device):
+            return 0
+        reply = self._reply(device, num_bytes)
+        _fill(data_in, reply)
+        return len(reply)
+
+    def _write_read(self, aardvark, slave_addr, flags, out_num_bytes, data_out,
+                    num_written, in_num_bytes, data_in, num_read):
+        # One round trip; the device stretches the clock through its
+        # settle time after the repeated start instead of NACKing.
+        self._round_trip()
+        _contents(num_written).value = 0
+        _contents(num_read).value = 0
+        if aardvark not in self._handles:
+            return AA_INVALID_HANDLE
+        device = self._device(aardvark, slave_addr)
+        if device is None or self._nack(device):
+            return AA_OK
+        self._select(device, _bytes_of(data_out, out_num_bytes))
+        wait = device.ready_at - self._clock()
+        if wait > 0:
+            self._sleep(wait)
+        reply = self._reply(device, in_num_bytes)
+        _fill(data_in, reply)
+        _contents(num_written).value = out_num_bytes
+        _contents(num_read).value = len(reply)
+        return AA_OK
@@ -1,4 +1,8 @@
-﻿from aardvark_py3 import *
+﻿import time
+from collections import deque
+from array import array
+import ctypes as c
+from .aardvark_py3 import *
 from clint.textui import puts, indent, colored
 
 def InitialiseAardvark():
@@ -49,7 +53,24 @@ def InitialiseAardvark():
 def AardvarkSetBaudRate(handle, baud_rate):
   return aa_i2c_bitrate(handle, baud_rate)
 
+# Opt-in latency hook, called as hook(handle, transaction, seconds,
+# bytes_read) after every compiled transaction. See AardvarkI2CSetLatencyHook.
+_latency_hook = None
+
+def AardvarkI2CSetLatencyHook(hook):
+  # Install (or with None, remove) the latency hook; returns the previous one.
+  global _latency_hook
+  previous, _latency_hook = _latency_hook, hook
+  return previous
+
 def AardvarkI2CWriteRead(handle, transaction_details):
+  if isinstance(transaction_details, I2CTransaction):
+    if _latency_hook is None:
+      return _AardvarkI2CRun(handle, transaction_details)
+    start = time.perf_counter()
+    result = _AardvarkI2CRun(handle, transaction_details)
+    _latency_hook(handle, transaction_details, time.perf_counter() - start, result[1])
+    return result
   return _AardvarkI2CWriteRead(
     handle, 
     transaction_details['address'],
@@ -85,15 +106,113 @@ def IntToArray(i):
   result.reverse()
   return result
 
-def _AardvarkI2CWriteRead(handle, addr, command, data, bytes_to_read, delay):
+class I2CTransaction():
+  # A write/settle/read transaction compiled once at startup: the outgoing
+  # message bytes and the ctypes reply buffer are built here, so running
+  # it only costs the native calls. Instances are immutable; use replace()
+  # to derive one with different settings. The reply buffer is reused on
+  # every run, so a reply is only valid until the next run. 'signed' and
+  # 'endian' describe how the reply decodes to a number.
+  __slots__ = ('name', 'address', 'cmd', 'data', 'delay', 'bytes_to_read',
+               'period', 'decimation', 'device', 'firmware', 'fallback_delay',
+               'repeated_start', 'signed', 'endian', 'message', 'reply', 'reply_view')
+
+  _fields = ('name', 'address', 'cmd', 'data', 'delay', 'bytes_to_read',
+             'period', 'decimation', 'device', 'firmware', 'fallback_delay',
+             'repeated_start', 'signed', 'endian')
+
+  def __init__(self, address, cmd, data=None, delay=0, bytes_to_read=0, name=None,
+               period=None, decimation=None, device=None, firmware=None,
+               fallback_delay=None, repeated_start=False, signed=False, endian='big'):
+    if endian not in ('big', 'little'):
+      raise ValueError("endian must be 'big' or 'little'")
+    set_ = object.__setattr__
+    for field, value in zip(self._fields, (name, address, cmd, data, delay, bytes_to_read,
+                                           period, decimation, device, firmware,
+                                           fallback_delay, repeated_start, signed, endian)):
+      set_(self, field, value)
+    set_(self, 'message', bytes(_AardvarkI2CMessage(cmd, data)))
+    reply = (c.c_uint8 * max(bytes_to_read, 1))()
+    set_(self, 'reply', reply)
+    set_(self, 'reply_view', memoryview(reply).cast('B'))
+
+  def __setattr__(self, name, value):
+    raise AttributeError('I2CTransaction is immutable')
+
+  def __reduce__(self):
+    return (_I2CTransactionFromFields, (self.fields(),))
+
+  def __repr__(self):
+    return 'I2CTransaction(%s)' % ', '.join(
+      '%s=%r' % (f, getattr(self, f)) for f in self._fields
+      if getattr(self, f) not in (None, False) and (f, getattr(self, f)) != ('endian', 'big'))
+
+  def fields(self):
+    return {f: getattr(self, f) for f in self._fields}
 
+  def replace(self, **changes):
+    fields = self.fields()
+    fields.update(changes)
+    return I2CTransaction(**fields)
+
+  def bind_reply(self, buffer, offset):
+    # Return a copy that reads its reply straight into buffer[offset:],
+    # e.g. a slot in a cycle-wide buffer. The binding is not pickled.
+    bound = I2CTransaction(**self.fields())
+    reply = (c.c_uint8 * max(self.bytes_to_read, 1)).from_buffer(buffer, offset)
+    object.__setattr__(bound, 'reply', reply)
+    object.__setattr__(bound, 'reply_view', memoryview(reply).cast('B'))
+    return bound
+
+  @classmethod
+  def compile(cls, transaction):
+    if isinstance(transaction, cls):
+      return transaction
+    return cls(**{f: transaction[f] for f in cls._fields if f in transaction})
+
+def _I2CTransactionFromFields(fields):
+  return I2CTransaction(**fields)
+
+def _AardvarkI2CRun(handle, transaction):
+    if transaction.repeated_start and transaction.bytes_to_read:
+      return _AardvarkI2CCombined(handle, transaction)
+
+    addr = transaction.address
+    bytes_written = aa_i2c_write_from(handle, addr, AA_I2C_NO_FLAGS, transaction.message)
+    aa_sleep_ms(transaction.delay)
+
+    if transaction.bytes_to_read:
+      bytes_read = aa_i2c_read_into(
+          handle, addr, AA_I2C_NO_FLAGS, transaction.reply, transaction.bytes_to_read)
+      return (transaction.reply_view[:max(bytes_read, 0)], bytes_read, bytes_written)
+    else:
+      return (0, 0, 0)
+
+def _AardvarkI2CCombined(handle, transaction):
+    # Write, repeated start, read: no STOP and no host sleep in between.
+    (status, bytes_written, bytes_read) = aa_i2c_write_read_into(
+        handle, transaction.address, AA_I2C_NO_FLAGS, transaction.message,
+        transaction.reply, transaction.bytes_to_read)
+    if status < 0:
+      bytes_read = status
+    return (transaction.reply_view[:max(bytes_read, 0)], bytes_read, bytes_written)
+
+def _AardvarkI2CMessage(command, data):
     message = [command]
     if not(data is None):
       data_array = IntToArray(data[:]) if (isinstance(data, (list, tuple))) else IntToArray(data) # Format Data Field
       message.extend(data_array)
 
-    data_out = array('B', message)
-    bytes_written = aa_i2c_write(handle, addr, AA_I2C_NO_FLAGS, data_out)
+    return array('B', message)
+
+def _AardvarkI2CWrite(handle, addr, command, data):
+
+    data_out = _AardvarkI2CMessage(command, data)
+    return aa_i2c_write(handle, addr, AA_I2C_NO_FLAGS, data_out)
+
+def _AardvarkI2CWriteRead(handle, addr, command, data, bytes_to_read, delay):
+
+    bytes_written = _AardvarkI2CWrite(handle, addr, command, data)
     aa_sleep_ms(delay)
 
     if bytes_to_read:
@@ -104,5 +223,78 @@ def _AardvarkI2CWriteRead(handle, addr, command, data, bytes_to_read, delay):
     else:
       return (0, 0, 0)
 
+def AardvarkI2CPipeline(handle, transactions):
+  # Run a list of write/settle/read transactions, overlapping the settle
+  # delays of different slave addresses: while one device is settling the
+  # next address is written, and each read is collected once its own delay
+  # has expired. Transactions to the same address stay strictly in order.
+  # Returns one (data_in, bytes_read, bytes_written) per transaction, in
+  # the order given.
+  transactions = [I2CTransaction.compile(t) for t in transactions]
+  results = [None] * len(transactions)
+  queues = {}
+  for index, transaction in enumerate(transactions):
+    queues.setdefault(transaction.address, deque()).append(index)
+
+  in_flight = []
+  while queues or in_flight:
+    for addr in list(queues):
+      if any(flight[1] == addr for flight in in_flight):
+        continue
+      index = queues[addr].popleft()
+      if not queues[addr]:
+        del queues[addr]
+      transaction = transactions[index]
+      started = time.perf_counter()
+      bytes_written = aa_i2c_write_from(handle, addr, AA_I2C_NO_FLAGS, transaction.message)
+      if transaction.bytes_to_read:
+        in_flight.append((time.monotonic() + transaction.delay / 1000.0, addr, index,
+                          bytes_written, started))
+      else:
+        results[index] = (0, 0, 0)
+
+    if not in_flight:
+      continue
+
+    in_flight.sort()
+    ready, addr, index, bytes_written, started = in_flight.pop(0)
+    wait = ready - time.monotonic()
+    if wait > 0:
+      time.sleep(wait)
+    transaction = transactions[index]
+    bytes_read = aa_i2c_read_into(
+        handle, addr, AA_I2C_NO_FLAGS, transaction.reply, transaction.bytes_to_read)
+    results[index] = (transaction.reply_view[:max(bytes_read, 0)], bytes_read, bytes_written)
+    if _latency_hook is not None:
+      _latency_hook(handle, transaction, time.perf_counter() - started, bytes_read)
+
+  return results
+
+def AardvarkI2CBatch(handle, transactions):
+  # Run a cycle's transactions with as few host/adapter round trips as the
+  # devices allow: repeated-start transactions go back to back with no
+  # host sleeps, the rest through AardvarkI2CPipeline. Results are in the
+  # order given.
+  transactions = [I2CTransaction.compile(t) for t in transactions]
+  results = [None] * len(transactions)
+  pipelined = []
+  for index, transaction in enumerate(transactions):
+    if transaction.repeated_start and transaction.bytes_to_read:
+      if _latency_hook is None:
+        results[index] = _AardvarkI2CCombined(handle, transaction)
+      else:
+        start = time.perf_counter()
+        results[index] = _AardvarkI2CCombined(handle, transaction)
+        _latency_hook(handle, transaction, time.perf_counter() - start, results[index][1])
+    else:
+      pipelined.append(index)
+
+  if pipelined:
+    pipeline_results = AardvarkI2CPipeline(handle, [transactions[i] for i in pipelined])
+    for index, result in zip(pipelined, pipeline_results):
+      results[index] = result
+
+  return results
+
 def CloseAardvark(handle):
   aa_close(handle)
@@ -0,0 +1,208 @@
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+class SampleRing():
+    """Single-writer, single-reader ring of decoded samples in shared memory.
+
+    Each slot holds [cycle, timestamp, value...] as float64 with a parallel
+    validity row. The writer fills a slot and only then bumps the write
+    counter. Every slot also has a sequence number (a seqlock): odd while
+    write n is filling it, 2n + 2 once it holds write n. The reader checks
+    it before and after copying a slot, so when it falls a whole ring
+    behind, slots overwritten under it are dropped rather than returned
+    torn.
+    """
+
+    def __init__(self, columns, slots=64, name=None):
+        self.columns = columns
+        self.slots = slots
+        width = columns + 2
+        data_bytes = slots * width * 8
+        data_offset = 8 + slots * 8
+        size = data_offset + data_bytes + slots * columns
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+        else:
+            # Workers are spawned from the owner and share its resource
+            # tracker, so only the owner unlinks the block.
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        buf = self._shm.buf
+        self._count = np.ndarray((1,), np.int64, buf, 0)
+        self._sequence = np.ndarray((slots,), np.int64, buf, 8)
+        self._data = np.ndarray((slots, width), np.float64, buf, data_offset)
+        self._valid = np.ndarray((slots, columns), np.bool_, buf, data_offset + data_bytes)
+        if self._owner:
+            self._count[0] = 0
+            self._sequence[:] = 0
+        self._read = 0
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def write(self, cycle, timestamp, values, valid):
+        count = int(self._count[0])
+        slot = count % self.slots
+        self._sequence[slot] = 2 * count + 1
+        self._data[slot, 0] = cycle
+        self._data[slot, 1] = timestamp
+        self._data[slot, 2:] = values
+        self._valid[slot] = valid
+        self._sequence[slot] = 2 * count + 2
+        self._count[0] = count + 1
+
+    def read(self):
+        """Return (cycle, timestamp, values, valid) for every new slot that
+        could be read whole."""
+        count = int(self._count[0])
+        start = max(self._read, count - self.slots)
+        samples = []
+        for n in range(start, count):
+            slot = n % self.slots
+            if self._sequence[slot] != 2 * n + 2:
+                continue
+            sample = (int(self._data[slot, 0]), float(self._data[slot, 1]),
+                      self._data[slot, 2:].copy(), self._valid[slot].copy())
+            if self._sequence[slot] == 2 * n + 2:
+                samples.append(sample)
+        self._read = count
+        return samples
+
+    def close(self):
+        self._count = self._data = self._valid = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+def adapter_worker(port, transactions, ring_name, columns, start_time, period, decimation,
+                   stop):
+    # Runs in its own process: opens the adapter itself, since Aardvark
+    # handles cannot be shared between processes. The transactions arrive
+    # compiled (and calibrated), pickled from the parent. Cycles are timed
+    # from `start_time` on time.monotonic(), which every process shares and
+    # a wall clock step does not move; samples are stamped with time.time().
+    from thermallogger import open_aardvark, retry_word
+    from aardvark.wrapper import AardvarkI2CBatch, CloseAardvark
+    from decode import TelemetryDecoder
+
+    ring = SampleRing(columns, name=ring_name)
+    decoder = TelemetryDecoder(transactions)
+    transactions = decoder.transactions
+    handle = open_aardvark(port)
+    values = np.zeros(columns)
+    valid = np.zeros(columns, bool)
+    cycle = 0
+    try:
+        while not stop.is_set():
+            deadline = start_time + cycle * period
+            delay = deadline - time.monotonic()
+            if delay > 0 and stop.wait(delay):
+                break
+            timestamp = time.time()
+            due = [i for i in range(columns) if cycle % decimation[i] == 0]
+            run = [transactions[i] for i in due]
+            results = AardvarkI2CBatch(handle, run)
+            values[:], valid[:] = decoder.decode(run, results)
+            for i in due:
+                if valid[i]:
+                    continue
+                try:
+                    values[i] = retry_word(handle, transactions[i])
+                    valid[i] = True
+                except IndexError:
+                    pass
+            ring.write(cycle, timestamp, values, valid)
+            cycle = max(cycle + 1, int((time.monotonic() - start_time) // period) + 1)
+    finally:
+        CloseAardvark(handle)
+        ring.close()
+
+class AdapterProcessPool():
+    """Serve each Aardvark port from its own worker process.
+
+    `instances` maps serial number to a dict with the adapter 'port' and
+    its compiled 'Transactions', which are sent to the worker. Workers
+    sample on a shared schedule, reading each column on its scheduler
+    decimation, and collect() merges whatever each ring holds for a given
+    cycle, so a wedged adapter only leaves its own columns empty.
+    """
+
+    def __init__(self, instances, period, scheduler=None, slots=64, worker=adapter_worker):
+        self._instances = instances
+        self._period = period
+        self._scheduler = scheduler
+        self._slots = slots
+        self._worker = worker
+        self._context = multiprocessing.get_context('spawn')
+        self._stop = self._context.Event()
+        self._rings = {}
+        self._processes = []
+        self._pending = {}
+        self.missed_samples = {str(serial_number): 0 for serial_number in instances}
+        self.start_time = None
+
+    @property
+    def pending_samples(self):
+        return len(self._pending)
+
+    def start(self, start_time=None):
+        # start_time is on time.monotonic(), like the event loop's clock.
+        self.start_time = start_time or time.monotonic() + 1.0
+        for serial_number, instance in self._instances.items():
+            transactions = instance['Transactions']
+            columns = [(str(serial_number), t.name) for t in transactions]
+            if self._scheduler is None:
+                decimation = [1] * len(columns)
+            else:
+                decimation = [self._scheduler.decimation.get(column, 1) for column in columns]
+            ring = SampleRing(len(columns), self._slots)
+            self._rings[str(serial_number)] = (ring, columns)
+            process = self._context.Process(
+                target=self._worker, daemon=True,
+                name='adapter-%s' % serial_number,
+                args=(instance['port'], transactions, ring.name, len(columns),
+                      self.start_time, self._period, decimation, self._stop))
+            process.start()
+            self._processes.append(process)
+        return self.start_time
+
+    def collect(self, cycle, timeout):
+        """Return the merged row for `cycle`, waiting up to `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        row = {}
+        waiting = set(self._rings)
+        while True:
+            for serial_number in list(waiting):
+                ring, columns = self._rings[serial_number]
+                for sample in ring.read():
+                    self._pending[(serial_number, sample[0])] = sample
+                # Samples older than the cycle being merged are stale.
+                for key in [k for k in self._pending if k[0] == serial_number and k[1] < cycle]:
+                    del self._pending[key]
+                sample = self._pending.pop((serial_number, cycle), None)
+                if sample is not None:
+                    _, timestamp, values, valid = sample
+                    for column, value, ok in zip(columns, values.tolist(), valid.tolist()):
+                        if ok:
+                            row[column] = value
+                    waiting.discard(serial_number)
+            if not waiting or time.monotonic() >= deadline:
+                for serial_number in waiting:
+                    self.missed_samples[serial_number] += 1
+                return row
+            time.sleep(0.001)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        for ring, columns in self._rings.values():
+            ring.close()
+        self._rings.clear()
+        self._processes.clear()
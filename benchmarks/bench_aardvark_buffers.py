@@ -0,0 +1,47 @@
+"""Microbenchmark of the aa_i2c_read/aa_i2c_write marshalling paths.
+
+The native calls are replaced by no-op stand-ins, so the numbers are the
+Python-side cost per call only: allocating and copying with
+aa_i2c_read/aa_i2c_write against the caller-owned buffer variants.
+
+    python benchmarks/bench_aardvark_buffers.py [calls]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('AARDVARK_BACKEND', 'sim')
+
+from aardvark import aardvark_py3 as aa
+
+class _NullApi():
+    @staticmethod
+    def c_aa_i2c_read(aardvark, slave_addr, flags, n_bytes, data_in):
+        return n_bytes
+
+    @staticmethod
+    def c_aa_i2c_write(aardvark, slave_addr, flags, n_bytes, data_out):
+        return n_bytes
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    aa.aa_set_backend(_NullApi())
+    message = aa.array('B', [0x10, 0xE2, 0x00])
+    message_bytes = bytes(message)
+    reply = bytearray(2)
+    reply_ctypes = aa.buffer_u08(reply)
+
+    cases = (
+        ('aa_i2c_read', lambda: aa.aa_i2c_read(1, 0x2B, 0, 2)),
+        ('aa_i2c_read_into', lambda: aa.aa_i2c_read_into(1, 0x2B, 0, reply)),
+        ('aa_i2c_read_into (ctypes)', lambda: aa.aa_i2c_read_into(1, 0x2B, 0, reply_ctypes)),
+        ('aa_i2c_write', lambda: aa.aa_i2c_write(1, 0x2B, 0, message)),
+        ('aa_i2c_write_from', lambda: aa.aa_i2c_write_from(1, 0x2B, 0, message_bytes)),
+    )
+    for name, call in cases:
+        elapsed = min(timeit.repeat(call, number=calls, repeat=3))
+        print('%-26s %7.3f us/call' % (name, elapsed / calls * 1e6))
+
+if __name__ == '__main__':
+    main()
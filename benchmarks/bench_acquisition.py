@@ -0,0 +1,193 @@
+"""Acquisition benchmark: run_tlm_log cycles against simulated adapters and
+the stand-in Keithley, over a grid of adapter counts and TLE codes per
+device.
+
+For each point it reports throughput (samples/s), cycle-time percentiles
+and a per-cycle stage breakdown: I2C write, settle, read (and combined
+write/read with --repeated-start), decode, Keithley query and storage
+append. Stage times are summed over the worker threads, so with several
+adapters they can add up to more than the cycle time. Results are JSON,
+to stdout or --json, so runs can be compared over time.
+
+    python benchmarks/bench_acquisition.py --adapters 1,4,16 --codes 8,32
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('AARDVARK_BACKEND', 'sim')
+
+import numpy as np
+
+import thermallogger as tl
+from decode import TelemetryDecoder
+from aardvark import aardvark_py3 as aa
+from aardvark.simulator import SimulatedAardvarkApi, SimulatedAdapter, devices_from_config
+from keithley import Keithley
+from keithley_sim import FakeKeithleySCPI, FakeKeithleySocketServer
+
+STAGES = ('i2c_write', 'settle', 'i2c_read', 'i2c_write_read', 'decode',
+          'keithley_query', 'store_append')
+
+class _StageTimer():
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    def wrap(self, stage, function):
+        totals = self.totals
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                totals[stage] += perf_counter() - start
+        return timed
+
+def _device_config(codes, repeated_start):
+    tle_codes = {'TLM%02d' % i: '0x%04X' % (0xE200 + 4 * i) for i in range(codes)}
+    return {'devices': {'EPS': {'Address': '0x2B', 'Repeated start': repeated_start,
+                                'TLE codes': tle_codes}}}
+
+def _keithley_channels(adapters):
+    channels = [c for c in range(1, 41) if c not in tl.TEMPERATURE_CHANNELS]
+    return channels[:adapters]
+
+def run_point(adapters, codes, args):
+    timer = _StageTimer()
+    config = _device_config(codes, args.repeated_start)
+    api = SimulatedAardvarkApi(
+        [SimulatedAdapter(2237000000 + i, devices_from_config(config, args.settle_ms))
+         for i in range(adapters)],
+        usb_latency_ms=args.usb_ms)
+    for name in ('c_aa_i2c_write', 'c_aa_i2c_read', 'c_aa_i2c_write_read'):
+        setattr(api, name, timer.wrap(name[5:], getattr(api, name)))
+    aa.aa_set_backend(api)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(config, f)
+    channels = _keithley_channels(adapters)
+    instances = {}
+    for port, unique_id in tl.create_aardvark_list().items():
+        transactions = [t.replace(delay=args.delay_ms)
+                        for t in tl.generate_transactions(f.name).values()]
+        instances['SN%d' % port] = {
+            'handle': tl.open_aardvark(port),
+            'port': port,
+            'config': f.name,
+            'Transactions': transactions,
+            'keithley channels': [channels[port]],
+            'keithley rates': {},
+        }
+    os.unlink(f.name)
+
+    server = FakeKeithleySocketServer(FakeKeithleySCPI(reading_time=args.keithley_ms / 1000.0))
+    host, port = server.start()
+    keithley = Keithley(tcp='%s:%d' % (host, port))
+    tl.configure_keithley_scan(keithley, instances)
+    keithley.readScan = timer.wrap('keithley_query', keithley.readScan)
+    store = tl.build_store(instances)
+    store.append = timer.wrap('store_append', store.append)
+    executor = tl.create_executor(instances) if args.threads else None
+
+    batch, decode = tl.AardvarkI2CBatch, TelemetryDecoder.decode
+    tl.AardvarkI2CBatch = timer.wrap('i2c_batch', batch)
+    TelemetryDecoder.decode = timer.wrap('decode', decode)
+    cycle_times = []
+    try:
+        for _ in range(args.warmup):
+            tl.run_tlm_log(store, instances, keithley, executor)
+        timer.totals.clear()
+        api.calls = 0
+        for _ in range(args.cycles):
+            start = time.perf_counter()
+            tl.run_tlm_log(store, instances, keithley, executor)
+            cycle_times.append(time.perf_counter() - start)
+    finally:
+        tl.AardvarkI2CBatch, TelemetryDecoder.decode = batch, decode
+        if executor is not None:
+            executor.shutdown()
+        keithley.close()
+        server.stop()
+        for instance in instances.values():
+            aa.aa_close(instance['handle'])
+
+    totals = timer.totals
+    totals['settle'] = max(0.0, totals.pop('i2c_batch', 0.0) - totals['i2c_write']
+                           - totals['i2c_read'] - totals['i2c_write_read'])
+    cycle_ms = np.array(cycle_times) * 1e3
+    samples = adapters * codes + len(instances) + len(tl.TEMPERATURE_CHANNELS)
+    return {
+        'adapters': adapters,
+        'codes': codes,
+        'cycles': args.cycles,
+        'samples_per_cycle': samples,
+        'samples_per_s': samples * args.cycles / (cycle_ms.sum() / 1e3),
+        'usb_calls_per_cycle': api.calls / args.cycles,
+        'cycle_ms': {
+            'mean': float(cycle_ms.mean()),
+            'p50': float(np.percentile(cycle_ms, 50)),
+            'p90': float(np.percentile(cycle_ms, 90)),
+            'p99': float(np.percentile(cycle_ms, 99)),
+            'max': float(cycle_ms.max()),
+        },
+        'stage_ms_per_cycle': {stage: totals[stage] * 1e3 / args.cycles for stage in STAGES},
+    }
+
+def _int_list(text):
+    return [int(value) for value in text.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--adapters', type=_int_list, default=[1, 2, 4, 8, 16])
+    parser.add_argument('--codes', type=_int_list, default=[8, 32],
+                        help='TLE codes per device')
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--delay-ms', type=int, default=25,
+                        help='settle delay in each transaction')
+    parser.add_argument('--settle-ms', type=float, default=5.0,
+                        help='simulated device settle time')
+    parser.add_argument('--usb-ms', type=float, default=1.0,
+                        help='simulated USB round trip per call')
+    parser.add_argument('--keithley-ms', type=float, default=0.0,
+                        help='simulated Keithley time per reading')
+    parser.add_argument('--repeated-start', action='store_true',
+                        help='use combined-format write/read transactions')
+    parser.add_argument('--serial', dest='threads', action='store_false',
+                        help='poll adapters one after another instead of in threads')
+    parser.add_argument('--json', help='write results here instead of stdout')
+    args = parser.parse_args()
+
+    results = []
+    for adapters in args.adapters:
+        for codes in args.codes:
+            result = run_point(adapters, codes, args)
+            results.append(result)
+            print('%2d adapters %3d codes  %8.1f samples/s  p50 %7.1f ms  p99 %7.1f ms' % (
+                adapters, codes, result['samples_per_s'], result['cycle_ms']['p50'],
+                result['cycle_ms']['p99']), file=sys.stderr)
+
+    report = {
+        'benchmark': 'acquisition',
+        'time': time.time(),
+        'python': platform.python_version(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'json'},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
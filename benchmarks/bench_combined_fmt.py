@@ -0,0 +1,48 @@
+"""Compare split write/sleep/read against combined-format (repeated start)
+transactions for one cycle of telemetry reads.
+
+Runs against the simulated backend, which charges a fixed USB round trip
+per call and NACKs reads issued before the device has settled, so the
+numbers show the round trips and host sleeps each mode costs rather than
+the bus itself.
+
+    python benchmarks/bench_combined_fmt.py [cycles] [usb_ms] [settle_ms]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('AARDVARK_BACKEND', 'sim')
+
+from aardvark import aardvark_py3 as aa
+from aardvark.simulator import SimulatedAardvarkApi, SimulatedAdapter, SimulatedDevice
+from aardvark.wrapper import AardvarkI2CBatch, I2CTransaction
+
+def _transactions(repeated_start, delay_ms):
+    return [I2CTransaction(0x2B, 0x10, 0xE200 + 4 * i, delay_ms, 2, name='TLM%d' % i,
+                           repeated_start=repeated_start)
+            for i in range(8)]
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    usb_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    settle_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+    for name, repeated_start in (('write/sleep/read', False), ('repeated start', True)):
+        device = SimulatedDevice(0x2B, {0xE200 + 4 * i: i for i in range(8)}, settle_ms)
+        api = SimulatedAardvarkApi([SimulatedAdapter(1, [device])], usb_latency_ms=usb_ms)
+        aa.aa_set_backend(api)
+        handle = aa.aa_open(0)
+        transactions = _transactions(repeated_start, int(settle_ms + 1))
+        api.calls = 0
+        start = time.perf_counter()
+        for _ in range(cycles):
+            results = AardvarkI2CBatch(handle, transactions)
+        elapsed = (time.perf_counter() - start) / cycles
+        complete = sum(bytes_read == 2 for _, bytes_read, _ in results)
+        print('%-18s %7.2f ms/cycle %5.1f USB calls/cycle %d/%d reads complete' % (
+            name, elapsed * 1e3, api.calls / cycles, complete, len(transactions)))
+        aa.aa_close(handle)
+
+if __name__ == '__main__':
+    main()
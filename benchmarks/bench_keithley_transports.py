@@ -0,0 +1,70 @@
+"""Compare the Keithley LAN transports: per-request urlopen(), the persistent
+HTTP session and the raw SCPI socket (single and pipelined queries).
+
+Runs against the local stand-in server, no meter required:
+
+    python benchmarks/bench_keithley_transports.py [readings]
+"""
+import os
+import sys
+import time
+from urllib.request import urlopen
+from urllib.parse import quote_plus
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from keithley import Keithley
+from keithley_sim import FakeKeithleyHTTPServer, FakeKeithleySocketServer
+
+def bench_urlopen(host, port, readings):
+    url = 'http://%s:%d/scpi_response.html?cmd=%s' % (
+        host, port, quote_plus('MEAS:VOLT:DC? (@101)'))
+    start = time.perf_counter()
+    for _ in range(readings):
+        urlopen(url).read()
+    return time.perf_counter() - start
+
+def bench_session(host, port, readings):
+    keithley = Keithley(ip=host, port=port)
+    start = time.perf_counter()
+    for _ in range(readings):
+        keithley.channel[1].getVoltageDC()
+    elapsed = time.perf_counter() - start
+    keithley.close()
+    return elapsed
+
+def bench_socket(host, port, readings):
+    keithley = Keithley(tcp='%s:%d' % (host, port))
+    start = time.perf_counter()
+    for _ in range(readings):
+        keithley.channel[1].getVoltageDC()
+    elapsed = time.perf_counter() - start
+    keithley.close()
+    return elapsed
+
+def bench_pipelined(host, port, readings):
+    keithley = Keithley(tcp='%s:%d' % (host, port))
+    start = time.perf_counter()
+    keithley.queryMany(['MEAS:VOLT:DC? (@101)'] * readings)
+    elapsed = time.perf_counter() - start
+    keithley.close()
+    return elapsed
+
+def main():
+    readings = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    benches = (
+        ('urlopen', bench_urlopen, FakeKeithleyHTTPServer),
+        ('session', bench_session, FakeKeithleyHTTPServer),
+        ('socket', bench_socket, FakeKeithleySocketServer),
+        ('pipeline', bench_pipelined, FakeKeithleySocketServer),
+    )
+    for name, bench, server_class in benches:
+        server = server_class()
+        host, port = server.start()
+        elapsed = bench(host, port, readings)
+        server.stop()
+        print('%-8s %8.1f us/reading  %4d connections' % (
+            name, elapsed / readings * 1e6, server.connections))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+# Per-device status written to the log each cycle.
+STATUS_OK = 0
+STATUS_FAILED = 1      # error, missed deadline or no data
+STATUS_OPEN = 2        # skipped: the circuit breaker is open
+STATUS_DETACHED = 3    # adapter missing or unplugged
+
+class CircuitBreaker():
+    """Decide whether a failing device is polled this cycle.
+
+    Closed, the device is polled every cycle. After `threshold` failed
+    cycles in a row the breaker opens and the device is skipped until
+    `backoff` seconds have passed; it is then probed once (half-open). A
+    good probe closes the breaker, a failed one reopens it with the wait
+    doubled, up to `max_backoff`.
+    """
+
+    def __init__(self, threshold=3, backoff=1.0, max_backoff=60.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._clock = clock
+        self.failures = 0
+        self.opened = 0
+        self._wait = backoff
+        self._retry_at = None
+
+    @property
+    def state(self):
+        if self._retry_at is None:
+            return 'closed'
+        return 'half-open' if self._clock() >= self._retry_at else 'open'
+
+    def allow(self):
+        return self._retry_at is None or self._clock() >= self._retry_at
+
+    def record(self, ok):
+        if ok:
+            self.reset()
+            return
+        self.failures += 1
+        if self._retry_at is not None:
+            self._wait = min(self._wait * 2, self.max_backoff)
+        elif self.failures < self.threshold:
+            return
+        else:
+            self.opened += 1
+        self._retry_at = self._clock() + self._wait
+
+    def reset(self):
+        self.failures = 0
+        self._wait = self.backoff
+        self._retry_at = None
+
+def _retrieve(future):
+    # A call left behind at its deadline may still fail; fetch the
+    # exception so asyncio does not report it as never retrieved.
+    if not future.cancelled():
+        future.exception()
+
+class DeviceGuard():
+    """Deadline and circuit breaker for one device in the acquisition cycle.
+
+    A call that misses its deadline is not cancelled (a half-finished I2C
+    or SCPI exchange would leave the device out of step) but left to
+    finish on its own, and the device is not called again until it has.
+    """
+
+    def __init__(self, deadline, breaker):
+        self.deadline = deadline
+        self.breaker = breaker
+        self.status = STATUS_OK
+        self.pending = None
+        self.last_error = None
+
+    async def run(self, call, succeeded=None):
+        """Await `call()` within the deadline; return its result, or None
+        when the device is skipped or fails. Sets `status`."""
+        if not self.breaker.allow():
+            self.status = STATUS_OPEN
+            return None
+        if self.pending is not None and not self.pending.done():
+            return self._failed(None)
+        self.pending = None
+
+        future = asyncio.ensure_future(call())
+        done, _ = await asyncio.wait({future}, timeout=self.deadline)
+        if not done:
+            self.pending = future
+            future.add_done_callback(_retrieve)
+            return self._failed(asyncio.TimeoutError('missed %.3f s deadline' % self.deadline))
+        try:
+            result = future.result()
+        except Exception as e:
+            return self._failed(e)
+        if succeeded is not None and not succeeded(result):
+            return self._failed(None)
+        self.breaker.record(True)
+        self.status = STATUS_OK
+        return result
+
+    def _failed(self, error):
+        self.last_error = error
+        self.breaker.record(False)
+        self.status = STATUS_FAILED
+        return None
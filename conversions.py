@@ -0,0 +1,137 @@
+"""Engineering-unit conversions for raw telemetry words.
+
+A TLE code in a device config may carry a "conversion" alongside its code:
+
+    "VPCM3V3": {"code": "0xE200", "conversion": {"scale": 0.008993, "unit": "V"}}
+
+with exactly one of
+
+    "scale" (and optional "offset")  value = raw * scale + offset
+    "poly": [c0, c1, c2, ...]        value = c0 + c1 * raw + c2 * raw**2 + ...
+    "table": [[raw, value], ...]     linear interpolation, clamped at the ends
+
+Conversions run on whole NumPy columns when rows are written or exported;
+the raw words are always kept and converted values go in extra columns
+named '<telemetry> [<unit>]'.
+
+Existing logs can be converted offline:
+
+    python conversions.py thing.csv SERIAL="eps thermal config.json" -o converted.csv
+
+Writing CSV dominates on large logs; an output ending in .parquet is
+written with 'serial/telemetry' column names, like ArrowLogWriter, and
+is far quicker (needs pyarrow).
+"""
+import argparse
+import json
+import sys
+import numpy as np
+
+class Conversion():
+    """One TLE code's raw word to engineering units; call it on a raw array."""
+
+    def __init__(self, scale=None, offset=0.0, poly=None, table=None, unit=None):
+        given = [name for name, value in (('scale', scale), ('poly', poly), ('table', table))
+                 if value is not None]
+        if len(given) != 1:
+            raise ValueError('a conversion needs exactly one of scale, poly or table')
+        self.unit = unit
+        if scale is not None:
+            self.kind = 'scale'
+            self._scale = float(scale)
+            self._offset = float(offset)
+        elif poly is not None:
+            self.kind = 'poly'
+            # Horner's scheme wants the highest power first.
+            self._coefficients = [float(c) for c in reversed(poly)]
+        else:
+            self.kind = 'table'
+            points = sorted((float(raw), float(value)) for raw, value in table)
+            self._raw = np.array([raw for raw, value in points])
+            self._values = np.array([value for raw, value in points])
+
+    @classmethod
+    def from_config(cls, entry):
+        """Return the Conversion for a TLE code config entry, or None."""
+        if not isinstance(entry, dict) or entry.get('conversion') is None:
+            return None
+        return cls(**entry['conversion'])
+
+    def __call__(self, raw):
+        raw = np.asarray(raw, np.float64)
+        if self.kind == 'scale':
+            return raw * self._scale + self._offset
+        if self.kind == 'poly':
+            result = np.full_like(raw, self._coefficients[0])
+            for coefficient in self._coefficients[1:]:
+                result *= raw
+                result += coefficient
+            return result
+        return np.interp(raw, self._raw, self._values)
+
+    def column_name(self, name):
+        return '%s [%s]' % (name, self.unit or 'eng')
+
+def conversion_settings(config):
+    """Return {telemetry name: Conversion arguments} for a device config
+    path or dict, as plain data."""
+    if not isinstance(config, dict):
+        with open(config) as f:
+            config = json.load(f)
+    settings = {}
+    for device in config['devices'].values():
+        for name, entry in device['TLE codes'].items():
+            if isinstance(entry, dict) and entry.get('conversion') is not None:
+                settings[name] = entry['conversion']
+    return settings
+
+def load_conversions(config):
+    """Return {telemetry name: Conversion} for a device config path or dict."""
+    return {name: Conversion(**settings)
+            for name, settings in conversion_settings(config).items()}
+
+def converted_column(column, conversion):
+    """Name of the converted column for a raw (serial, telemetry) column."""
+    if isinstance(column, tuple):
+        return column[:-1] + (conversion.column_name(column[-1]),)
+    return conversion.column_name(column)
+
+def convert_frame(frame, conversions):
+    """Add converted columns to a DataFrame of raw words.
+
+    `conversions` maps raw column to Conversion. Missing raw values stay
+    missing in the converted column.
+    """
+    for column, conversion in conversions.items():
+        if column not in frame.columns:
+            continue
+        raw = frame[column].to_numpy(np.float64, na_value=np.nan)
+        frame[converted_column(column, conversion)] = conversion(raw)
+    return frame
+
+def main():
+    parser = argparse.ArgumentParser(description='Add engineering-unit columns to a logged CSV')
+    parser.add_argument('log', help='CSV written by thermallogger')
+    parser.add_argument('configs', nargs='+', metavar='SERIAL=CONFIG',
+                        help='device config used for each serial number')
+    parser.add_argument('-o', '--output', help='output CSV or .parquet (default: CSV to stdout)')
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    conversions = {}
+    for item in args.configs:
+        serial_number, _, config = item.partition('=')
+        for name, conversion in load_conversions(config).items():
+            conversions[(serial_number, name)] = conversion
+
+    frame = pd.read_csv(args.log, header=[0, 1], index_col=0)
+    convert_frame(frame, conversions)
+    if args.output and args.output.endswith('.parquet'):
+        frame.columns = ['/'.join(column) for column in frame.columns]
+        frame.to_parquet(args.output)
+    else:
+        frame.to_csv(args.output or sys.stdout)
+
+if __name__ == '__main__':
+    main()
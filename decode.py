@@ -0,0 +1,92 @@
+import numpy as np
+
+WIDTHS = (1, 2, 4)
+
+def parse_format(entry):
+    """Pull the optional reply 'width' (bytes), 'signed' and 'endian' out of
+    a TLE code config entry, as I2CTransaction arguments."""
+    if not isinstance(entry, dict):
+        return {}
+    reply_format = {}
+    if entry.get('width') is not None:
+        if int(entry['width']) not in WIDTHS:
+            raise ValueError('reply width must be one of %s bytes' % (WIDTHS,))
+        reply_format['bytes_to_read'] = int(entry['width'])
+    if entry.get('signed') is not None:
+        reply_format['signed'] = bool(entry['signed'])
+    if entry.get('endian') is not None:
+        reply_format['endian'] = entry['endian']
+    return reply_format
+
+def reply_dtype(transaction):
+    """NumPy dtype of a transaction's reply: its width, signedness and endianness."""
+    kind = 'i' if transaction.signed else 'u'
+    order = '>' if transaction.endian == 'big' else '<'
+    return np.dtype('%s%s%d' % (order, kind, transaction.bytes_to_read))
+
+def column_dtype(transaction):
+    """Native integer dtype wide enough for a transaction's decoded values."""
+    return np.promote_types(reply_dtype(transaction).newbyteorder('='), np.int32)
+
+def decode_reply(transaction, data_read):
+    """Decode one reply on its own; raises IndexError if it is short."""
+    if len(data_read) < transaction.bytes_to_read:
+        raise IndexError('short reply from %s' % transaction.name)
+    return int.from_bytes(bytes(data_read[:transaction.bytes_to_read]), transaction.endian,
+                          signed=transaction.signed)
+
+class TelemetryDecoder():
+    """Decode a whole cycle of telemetry replies at once.
+
+    The transactions are rebound so each reads its reply straight into a
+    slot of one contiguous buffer, with replies of the same format packed
+    next to each other. decode() then turns every group into numbers with
+    a single np.frombuffer and builds a validity mask from the byte
+    counts the reads returned. Use `transactions` (the rebound copies),
+    not the originals, when running the cycle.
+    """
+
+    def __init__(self, transactions):
+        transactions = list(transactions)
+        self.widths = np.array([t.bytes_to_read for t in transactions], np.int64)
+        self._message_lengths = np.array([len(t.message) for t in transactions], np.int64)
+        groups = {}
+        for index, transaction in enumerate(transactions):
+            if transaction.bytes_to_read:
+                groups.setdefault(reply_dtype(transaction), []).append(index)
+
+        self.buffer = bytearray(max(int(self.widths.sum()), 1))
+        self.transactions = list(transactions)
+        self._groups = []
+        offset = 0
+        for dtype, indices in groups.items():
+            for index in indices:
+                self.transactions[index] = transactions[index].bind_reply(self.buffer, offset)
+                offset += dtype.itemsize
+            self._groups.append((dtype, offset - dtype.itemsize * len(indices), len(indices),
+                                 np.array(indices, np.intp)))
+        self._index = {id(t): i for i, t in enumerate(self.transactions)}
+
+    def decode(self, transactions, results):
+        """Return (values, valid) for every transaction after a cycle.
+
+        `transactions` are the ones run this cycle (a subset of
+        self.transactions) and `results` their (data_in, bytes_read,
+        bytes_written) tuples. Transactions that were not run, whose
+        request was not fully written (the device may still be answering
+        an earlier one) or whose reply came back short are marked invalid.
+        """
+        bytes_read = np.zeros(len(self.transactions), np.int64)
+        bytes_written = np.zeros(len(self.transactions), np.int64)
+        index = self._index
+        for transaction, result in zip(transactions, results):
+            i = index[id(transaction)]
+            bytes_read[i] = result[1]
+            bytes_written[i] = result[2]
+
+        values = np.zeros(len(self.transactions), np.int64)
+        for dtype, offset, count, indices in self._groups:
+            values[indices] = np.frombuffer(self.buffer, dtype, count, offset)
+        valid = ((bytes_read == self.widths) & (bytes_written == self._message_lengths)
+                 & (self.widths > 0))
+        return values, valid
@@ -0,0 +1,53 @@
+import asyncio
+import sys
+
+class AcquisitionEngine():
+    """Run an acquisition cycle on a fixed, drift-free period.
+
+    `cycle` is a coroutine function taking the cycle number. Deadlines are
+    start + n * period on the event loop's monotonic clock, so a slow
+    cycle never pushes later ones back. If a cycle overruns one or more
+    deadlines those cycles are skipped, counted in `missed_deadlines` and
+    reported through `on_missed(cycle, missed)`.
+    """
+
+    def __init__(self, cycle, period, on_missed=None):
+        self._cycle = cycle
+        self.period = period
+        self.on_missed = on_missed or self._report_missed
+        self.cycles = 0
+        self.missed_deadlines = 0
+        self.last_cycle_time = None
+        self._stopping = None
+
+    @staticmethod
+    def _report_missed(cycle, missed):
+        print('cycle %d overran, skipped %d deadline(s)' % (cycle, missed), file=sys.stderr)
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self, cycles=None, first_delay=0.0):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        start = loop.time() + first_delay
+        n = 0
+        while cycles is None or self.cycles < cycles:
+            deadline = start + n * self.period
+            try:
+                await asyncio.wait_for(self._stopping.wait(), max(0.0, deadline - loop.time()))
+                break
+            except asyncio.TimeoutError:
+                pass
+
+            began = loop.time()
+            await self._cycle(n)
+            self.cycles += 1
+            self.last_cycle_time = loop.time() - began
+
+            due = int((loop.time() - start) // self.period) + 1
+            if due > n + 1:
+                self.missed_deadlines += due - n - 1
+                self.on_missed(n, due - n - 1)
+            n = max(n + 1, due)
@@ -0,0 +1,118 @@
+import queue
+import sys
+import threading
+
+from aardvark.aardvark_py3 import AA_PORT_NOT_FREE, aa_close, aa_find_devices_ext
+from rig import manifest_key
+
+class AdapterWatcher():
+    """Attach and detach Aardvark adapters while acquisition runs.
+
+    A background thread calls aa_find_devices_ext every `interval`
+    seconds. A manifest adapter that shows up free is opened there, off
+    the acquisition path, with `open_adapter(port)`; an attached adapter
+    that has gone from the list, or shows up free again after being
+    reseated, is detached. Changes are queued and only made to
+    `instances` by apply(), which the acquisition loop calls between
+    cycles, so a cycle never sees an instance change under it and the
+    other adapters never wait.
+
+    Each change is reported as on_event(event, serial_number, instance)
+    with event 'attached' or 'detached'. Instances of detached adapters
+    keep their columns and have no handle. With `guards` (the DeviceGuards
+    by serial number), the handle of a detached adapter whose last call
+    overran its deadline is only closed by a later apply(), once that call
+    has finished with it.
+    """
+
+    def __init__(self, instances, manifest, open_adapter, interval=2.0, on_event=None,
+                 guards=None):
+        self.instances = instances
+        self.interval = interval
+        self.on_event = on_event
+        self.guards = guards or {}
+        self._closing = []
+        self._open_adapter = open_adapter
+        self._serials = {key: entry['serial'] for key, entry in manifest['adapters'].items()
+                         if entry['serial'] in instances}
+        self._attached = {key for key, serial_number in self._serials.items()
+                          if instances[serial_number]['handle'] is not None}
+        self._changes = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name='hotplug')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        # Handles opened after the last apply() were never handed over.
+        while not self._changes.empty():
+            event, serial_number, handle, port, unique_id = self._changes.get()
+            if event == 'attached':
+                aa_close(handle)
+        self._close_finished()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.scan()
+            except Exception as e:
+                print('adapter scan failed: %s' % e, file=sys.stderr)
+
+    def scan(self):
+        """Look for added and removed adapters once and queue the changes."""
+        (num, ports, ids) = aa_find_devices_ext(16, 16)
+        if num < 0:
+            return
+        present = {}
+        for port, unique_id in zip(ports, ids):
+            present[manifest_key(unique_id)] = (port & ~AA_PORT_NOT_FREE,
+                                                not port & AA_PORT_NOT_FREE, unique_id)
+
+        for key, serial_number in self._serials.items():
+            port, free, unique_id = present.get(key, (None, False, None))
+            if key in self._attached and (port is None or free):
+                self._attached.discard(key)
+                self._changes.put(('detached', serial_number, None, None, None))
+            if key not in self._attached and free:
+                handle = self._open_adapter(port)
+                if handle > 0:
+                    self._attached.add(key)
+                    self._changes.put(('attached', serial_number, handle, port, unique_id))
+
+    def _in_use(self, serial_number):
+        guard = self.guards.get(serial_number)
+        return guard is not None and guard.pending is not None and not guard.pending.done()
+
+    def _close_finished(self):
+        closing, self._closing = self._closing, []
+        for serial_number, handle in closing:
+            if self._in_use(serial_number):
+                self._closing.append((serial_number, handle))
+            else:
+                aa_close(handle)
+
+    def apply(self, n=None):
+        """Make the queued changes; call between cycles. Takes the cycle
+        number so it can be used as an on_cycle hook."""
+        self._close_finished()
+        while not self._changes.empty():
+            event, serial_number, handle, port, unique_id = self._changes.get()
+            instance = self.instances[serial_number]
+            if event == 'attached':
+                instance['handle'] = handle
+                instance['port'] = port
+                instance['unique id'] = unique_id
+            else:
+                old_handle = instance['handle']
+                instance['handle'] = None
+                if old_handle is not None:
+                    self._closing.append((serial_number, old_handle))
+                    self._close_finished()
+            if self.on_event is not None:
+                self.on_event(event, serial_number, instance)
@@ -0,0 +1,158 @@
+import json
+import sys
+import threading
+from bisect import bisect_left
+from re import compile as re_compile
+
+# Bucket upper bounds in milliseconds; slower samples land in an overflow
+# bucket. Fixed so recording is a bisect and an increment.
+DEFAULT_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+                     1000, 2500, 5000)
+
+_CHANNEL_LIST = re_compile(r"\(@([\d,:]+)\)")
+
+def _channels(cmd):
+    # Channel numbers in a '(@101,103:105)' list; the slot is the leading
+    # digit, so 101 is channel 1 and a:b covers every channel between.
+    match = _CHANNEL_LIST.search(cmd)
+    if match is None:
+        return []
+    channels = []
+    for item in match.group(1).split(','):
+        first, _, last = item.partition(':')
+        channels.extend(range(int(first[-2:]), int((last or first)[-2:]) + 1))
+    return channels
+
+class LatencyHistogram():
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound (seconds) of the bucket holding the q-th percentile,
+        capped at the largest sample seen."""
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1e3 if self.count else None,
+            'max_ms': self.max * 1e3,
+            'bounds_ms': [bound * 1e3 for bound in self.bounds],
+            'counts': list(self.counts),
+        }
+
+class Instrumentation():
+    """Opt-in latency histograms for the acquisition hot paths.
+
+    install() hooks every compiled I2C transaction (keyed by adapter, slave
+    address and command), each Keithley query (keyed by channel: a READ?
+    counts for every channel in the scan) and SampleStore.append. Nothing is
+    recorded until install() is called, and uninstall() removes the hooks.
+    `adapter_names` maps Aardvark handles to the names used in keys.
+    """
+
+    def __init__(self, bounds_ms=DEFAULT_BOUNDS_MS):
+        self._bounds = tuple(bound / 1000.0 for bound in bounds_ms)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.adapter_names = {}
+
+    def record(self, key, seconds):
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms.setdefault(key, LatencyHistogram(self._bounds))
+        with self._lock:
+            histogram.record(seconds)
+
+    def histogram(self, key):
+        return self._histograms.get(key)
+
+    def install(self):
+        from aardvark.wrapper import AardvarkI2CSetLatencyHook
+        from keithley import Keithley
+        from samplestore import SampleStore
+
+        AardvarkI2CSetLatencyHook(self._record_i2c)
+        Keithley.latency_hook = self._record_keithley
+        SampleStore.latency_hook = self._record_store
+        return self
+
+    def uninstall(self):
+        from aardvark.wrapper import AardvarkI2CSetLatencyHook
+        from keithley import Keithley
+        from samplestore import SampleStore
+
+        AardvarkI2CSetLatencyHook(None)
+        Keithley.latency_hook = None
+        SampleStore.latency_hook = None
+
+    def _record_i2c(self, handle, transaction, seconds, bytes_read):
+        command = '0x%02X' % transaction.cmd
+        if transaction.data is not None:
+            command += ':0x%04X' % transaction.data
+        self.record(('i2c', str(self.adapter_names.get(handle, handle)),
+                     '0x%02X' % transaction.address, command), seconds)
+
+    def _record_keithley(self, keithley, cmd, seconds):
+        # A READ? covers every channel in the configured scan. Other queries
+        # are keyed by the channels they name; settings (no '?') and queries
+        # naming none are keyed by their command header.
+        header = cmd.split(' ', 1)[0]
+        channels = []
+        if header.upper() == 'READ?':
+            channels = keithley._scan_channels
+        elif header.endswith('?'):
+            channels = _channels(cmd)
+        if not channels:
+            self.record(('keithley', header), seconds)
+            return
+        for channel in channels:
+            self.record(('keithley', str(channel)), seconds)
+
+    def _record_store(self, store, seconds):
+        self.record(('store', 'append'), seconds)
+
+    def snapshot(self):
+        """Return {key: histogram dict}; keys are joined with '/'."""
+        return {'/'.join(key): histogram.as_dict()
+                for key, histogram in sorted(self._histograms.items())}
+
+    def dump(self, file=None):
+        # Reads without the lock, so it is safe from a signal handler; a
+        # sample recorded concurrently may be missing from the totals.
+        file = file or sys.stderr
+        print('%-44s %8s %9s %9s %9s %9s' % ('latency', 'count', 'mean ms', 'p50 ms',
+                                            'p99 ms', 'max ms'), file=file)
+        for key, histogram in sorted(self._histograms.items()):
+            if not histogram.count:
+                continue
+            print('%-44s %8d %9.3f %9.3f %9.3f %9.3f' % (
+                '/'.join(key), histogram.count, histogram.total / histogram.count * 1e3,
+                histogram.percentile(50) * 1e3, histogram.percentile(99) * 1e3,
+                histogram.max * 1e3), file=file)
+        file.flush()
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
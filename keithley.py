@@ -1,9 +1,12 @@
-from urllib.request import urlopen
+import asyncio
+from http.client import HTTPConnection, HTTPException
 from urllib.parse import quote_plus
-from urllib.error import URLError
-from time import sleep
+from queue import LifoQueue, Empty
+from socket import create_connection, IPPROTO_TCP, TCP_NODELAY
+from threading import Lock
+from time import monotonic
 from serial import Serial
-from re import search
+from re import compile as re_compile, DOTALL
 
 class KeithleyTimeout(Exception):
     pass
@@ -17,6 +20,121 @@ class KeithleyNoConnection(Exception):
 class KeithleyNoProtocol(Exception):
     pass
 
+class _HttpSession():
+    # Small pool of persistent HTTP/1.1 connections to the meter's web
+    # server. A connection that drops is replaced once before giving up.
+
+    def __init__(self, host, port, timeout, size=1):
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._pool = LifoQueue()
+        for _ in range(size):
+            self._pool.put(None)
+
+    def _connect(self):
+        conn = HTTPConnection(self._host, self._port, timeout=self._timeout)
+        conn.connect()
+        conn.sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        return conn
+
+    def get(self, path, timeout=None):
+        conn = self._pool.get()
+        try:
+            for attempt in range(2):
+                try:
+                    if conn is None:
+                        conn = self._connect()
+                    conn.sock.settimeout(timeout or self._timeout)
+                    conn.request('GET', path, headers={'Connection': 'keep-alive'})
+                    response = conn.getresponse()
+                    body = response.read()
+                    if response.will_close:
+                        conn.close()
+                        conn = None
+                    return body
+                except TimeoutError:
+                    conn.close()
+                    conn = None
+                    raise KeithleyTimeout
+                except (OSError, HTTPException):
+                    if conn is not None:
+                        conn.close()
+                    conn = None
+                    if attempt:
+                        raise KeithleyNoConnection
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except Empty:
+                break
+            if conn is not None:
+                conn.close()
+
+class _SocketSession():
+    # One persistent raw SCPI socket. Commands are newline terminated and
+    # every query is answered by exactly one line, so several queries can
+    # be written in one go and their replies read back in order.
+
+    def __init__(self, host, port, timeout):
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._sock = None
+        self._rx = bytearray()
+        self._lock = Lock()
+
+    def _connect(self):
+        sock = create_connection((self._host, self._port), self._timeout)
+        sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        self._rx.clear()
+        return sock
+
+    def _readline(self):
+        while True:
+            end = self._rx.find(b'\n')
+            if end >= 0:
+                line = bytes(self._rx[:end])
+                del self._rx[:end + 1]
+                return line.strip()
+            chunk = self._sock.recv(4096)
+            if not chunk:
+                raise ConnectionResetError
+            self._rx += chunk
+
+    def _transact(self, cmds, replies, timeout=None):
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._sock = self._connect()
+                self._sock.settimeout(timeout or self._timeout)
+                self._sock.sendall(b''.join(b'%s\n' % cmd.encode('utf-8') for cmd in cmds))
+                return [self._readline() for _ in range(replies)]
+            except TimeoutError:
+                self.close()
+                raise KeithleyTimeout
+            except OSError:
+                self.close()
+                if attempt:
+                    raise KeithleyNoConnection
+
+    def write(self, cmd):
+        with self._lock:
+            self._transact([cmd], 0)
+
+    def query_many(self, cmds, timeout=None):
+        with self._lock:
+            return self._transact(cmds, len(cmds), timeout)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
 class KeithleyFeature():
    
   def __init__(self, parent, channel):
@@ -27,92 +145,145 @@ class KeithleyFeature():
   def _getSlotAndChannel(self):
     return '(@%s%s)' % (str(self._slot).zfill(1), str(self._channel).zfill(2))
 
-  def getVoltageDC(self):
-    command = 'MEASure:VOLTage:DC? %s' % self._getSlotAndChannel()
-    raw = self.parent._send(command)
+  def _parseReading(self, raw):
+    # The scan setup turns off units (FORMat:ELEMents READing), so take
+    # the leading number whether or not a unit follows it.
     if type(raw) is str:
-        try:
-            return float(raw.split(',')[0][:-3])
-        except (ValueError, IndexError):
+        match = self.parent._reading_pattern.match(raw.split(',')[0])
+        if match is None:
             raise KeithleyBadData
+        return float(match.group(1))
     else:
         return raw
-    
+
+  def getVoltageDC(self):
+    command = 'MEASure:VOLTage:DC? %s' % self._getSlotAndChannel()
+    return self._parseReading(self.parent._send(command))
 
   def getVoltageAC(self):
     command = 'MEASure:VOLTage:AC? %s' % self._getSlotAndChannel()
-    raw = self.parent._send(command)
-    if type(raw) is str:
-        try:
-            return float(raw.split(',')[0][:-3])
-        except (ValueError, IndexError):
-            raise KeithleyBadData
-    else:
-        return raw
+    return self._parseReading(self.parent._send(command))
 
   def getTemperature(self):
     command = 'MEAS:TEMP? %s' % self._getSlotAndChannel()
-    raw = self.parent._send(command)
-    if type(raw) is str:
-        try:
-            raw_tu = raw.split(',')[0]
-            temp = raw_tu[:-3]
-            units = raw_tu[-3:]
-            return float(temp)
-        except (ValueError, IndexError):
-            raise KeithleyBadData
-    else:
-        return raw
+    return self._parseReading(self.parent._send(command))
 
 class Keithley():
-    _ajax_url = "http://%s/scpi_response.html?cmd=%s"
-    _reg_pattern = r"(?<=\<body\>)(.*)(?=\<\/body\>)"
+    _ajax_path = "/scpi_response.html?cmd=%s"
+    _reg_pattern = re_compile(rb"<body>(.*?)</body>", DOTALL)
+    _reading_pattern = re_compile(r"\s*([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)")
     _error_timeout = "(Query time out)"
+    _terminators = (b'\n', b'\r')
+    _tcp_port = 1394
+    # Time allowed per scanned channel on top of the query timeout: relay
+    # settling and an integration at the default 1 PLC with autozero, plus
+    # the reading's characters on a serial line.
+    _channel_scan_time = 0.05
+    _reading_chars = 16
+    # Opt-in, called as latency_hook(keithley, cmd, seconds) after each query.
+    latency_hook = None
     _ip = None
     _comm = None
+    _serial = None
+    _tcp = None
   
-    def __init__(self, ip=None, comm=None, baud=9600, slot=1):
+    def __init__(self, ip=None, comm=None, baud=9600, slot=1, timeout=1.0,
+                 port=80, pool_size=1, tcp=None):
         if ip:
             self._ip = self._format_ip(ip)
+            self._http = _HttpSession(self._ip, port, timeout, pool_size)
+        elif tcp:
+            host, _, tcp_port = tcp.partition(':')
+            self._tcp = _SocketSession(host, int(tcp_port or self._tcp_port), timeout)
         elif comm:
-            self._serial = Serial(comm, baud, timeout=1)
+            self._serial = Serial(comm, baud, timeout=timeout)
         else:
             raise KeithleyNoProtocol
 
         self._slot = slot
+        self._timeout = timeout
+        self.rtt = {}
+        self.last_rtt = None
         self.channel = [KeithleyFeature(self, ch) for ch in range(0,21)]
+        self._scan_channels = []
+        self._scan_config = None
     
     def _format_ip(self, ip):
         return ".".join([str(int(o)) for o in ip.split('.')])
 
-    def _send_ip(self, cmd):
-        url = self._ajax_url % (self._ip, quote_plus(cmd))
+    def _send_ip(self, cmd, timeout=None):
+        start = monotonic()
+        data_raw = self._http.get(self._ajax_path % quote_plus(cmd), timeout)
+        self._record_rtt(cmd, start)
 
-        try:
-            data_raw = urlopen(url).read()
-        except URLError:
-            raise KeithleyNoConnection
+        match = self._reg_pattern.search(data_raw)
+        if match is None:
+            raise KeithleyBadData
 
-        data = search(self._reg_pattern, str(data_raw))[0]
+        data = match.group(1).decode('utf-8')
         if (data == self._error_timeout):
             raise KeithleyTimeout
         else:
             return data
     
-    def _send_comm(self, cmd):
-        self._serial.flush()
+    def _formatChannelList(self, channels):
+        return '(@%s)' % ','.join(
+            '%s%s' % (str(self._slot).zfill(1), str(ch).zfill(2)) for ch in channels)
+
+    def _record_rtt(self, cmd, start):
+        self.last_rtt = monotonic() - start
+        self.rtt[cmd] = self.last_rtt
+        if self.latency_hook is not None:
+            self.latency_hook(self, cmd, self.last_rtt)
+
+    def _write_comm(self, cmd):
+        self._serial.reset_input_buffer()
         self._serial.write(b"%s\n" % cmd.encode('UTF-8'))
-        sleep(0.5)
-        rx = self._serial.read_all()
-        rx = list(filter(lambda data: len(data), rx.split(b'\x13')))
+        self._serial.flush()
+
+    def _read_response(self, timeout, expected_len=None):
+        # Return as soon as a line terminator arrives rather than waiting
+        # out a fixed delay. expected_len lets short fixed-size replies
+        # come back in a single read call. Each read may only block for
+        # what is left of the deadline, so the whole reply is bounded by it.
+        deadline = monotonic() + timeout
+        rx = bytearray()
+        size = expected_len
+        while not any(t in rx for t in self._terminators):
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise KeithleyTimeout
+            self._serial.timeout = remaining
+            chunk = self._serial.read(size or self._serial.in_waiting or 1)
+            size = None
+            if not chunk:
+                raise KeithleyTimeout
+            rx += chunk
+
+        return bytes(rx)
+
+    def _query_comm(self, cmd, timeout=None, expected_len=None):
+        # Timed out queries are recorded too, at the time they took to fail.
+        start = monotonic()
+        try:
+            self._write_comm(cmd)
+            rx = self._read_response(timeout or self._timeout, expected_len)
+        finally:
+            self._record_rtt(cmd, start)
+        rx = list(filter(lambda data: len(data.strip()), rx.split(b'\x13')))
 
         # Check we've recieved a packet
         if not len(rx):
             raise KeithleyBadData
 
+        return rx[0].strip()
+
+    def _send_comm(self, cmd):
+        packet = self._query_comm(cmd)
+
         # Split up the packet
         try:
-            data = rx[0].split(b',')
+            data = packet.split(b',')
             try:
                 value = float(data[0])
             except ValueError:
@@ -123,14 +294,138 @@ class Keithley():
 
         return value
 
+    def _send_tcp(self, cmd, timeout=None):
+        start = monotonic()
+        data = self._tcp.query_many([cmd], timeout)[0].decode('utf-8')
+        self._record_rtt(cmd, start)
+        if (data == self._error_timeout):
+            raise KeithleyTimeout
+        else:
+            return data
+
+    def close(self):
+        if self._ip:
+            self._http.close()
+        elif self._tcp:
+            self._tcp.close()
+        elif self._serial:
+            self._serial.close()
+
     def _send(self, cmd):
         if self._ip:
             return self._send_ip(cmd)
+        elif self._tcp:
+            return self._send_tcp(cmd)
         elif self._serial:
             return self._send_comm(cmd)
         else:
             raise KeithleyNoProtocol
 
+    def _write(self, cmd):
+        if self._ip:
+            self._send_ip(cmd)
+        elif self._tcp:
+            self._tcp.write(cmd)
+        elif self._serial:
+            self._write_comm(cmd)
+        else:
+            raise KeithleyNoProtocol
+
+    def _query(self, cmd, timeout=None):
+        if self._ip:
+            return self._send_ip(cmd, timeout)
+        elif self._tcp:
+            return self._send_tcp(cmd, timeout)
+        elif self._serial:
+            return self._query_comm(cmd, timeout).decode('utf-8')
+        else:
+            raise KeithleyNoProtocol
+
+    def queryMany(self, cmds):
+        """Send several queries and return their replies in order.
+
+        On the raw socket transport the queries are pipelined in a single
+        write; the other transports fall back to one query at a time.
+        """
+        if self._tcp:
+            return [reply.decode('utf-8') for reply in self._tcp.query_many(cmds)]
+        return [self._query(cmd) for cmd in cmds]
+
+    def configureScan(self, vdc_channels=(), temp_channels=()):
+        """Set up a single internal scan over the given channels.
+
+        Every channel is assigned its function once here, so each later
+        readScan() is one trigger and one response for the whole list.
+        """
+        vdc_channels = sorted(int(ch) for ch in vdc_channels)
+        temp_channels = sorted(int(ch) for ch in temp_channels)
+        channels = sorted(vdc_channels + temp_channels)
+        if not channels:
+            raise KeithleyBadData
+        if (vdc_channels, temp_channels) == self._scan_config:
+            return
+
+        # Forget the old scan first, so a set-up that fails part way is
+        # sent again in full next time rather than taken as done.
+        self._scan_channels = []
+        self._scan_config = None
+        self._write('INITiate:CONTinuous OFF')
+        self._write('TRACe:CLEar')
+        self._write('FORMat:ELEMents READing')
+        if vdc_channels:
+            self._write("SENSe:FUNCtion 'VOLTage:DC', %s" % self._formatChannelList(vdc_channels))
+        if temp_channels:
+            self._write("SENSe:FUNCtion 'TEMPerature', %s" % self._formatChannelList(temp_channels))
+        self._write('TRIGger:SOURce IMMediate')
+        self._write('TRIGger:COUNt 1')
+        self._write('SAMPle:COUNt %d' % len(channels))
+        self._write('ROUTe:SCAN %s' % self._formatChannelList(channels))
+        self._write('ROUTe:SCAN:TSOurce IMMediate')
+        self._write('ROUTe:SCAN:LSELect INTernal')
+        self._scan_channels = channels
+        self._scan_config = (vdc_channels, temp_channels)
+
+    def _scan_timeout(self):
+        per_channel = self._channel_scan_time
+        if self._serial is not None:
+            per_channel += self._reading_chars * 10.0 / self._serial.baudrate
+        return self._timeout + len(self._scan_channels) * per_channel
+
+    def readScan(self, timeout=None):
+        """Trigger the configured scan and return {channel: value}.
+
+        The timeout defaults to the query timeout plus an allowance for
+        every channel in the scan.
+        """
+        if not self._scan_channels:
+            raise KeithleyBadData
+
+        return self._parseScan(self._query('READ?', timeout or self._scan_timeout()))
+
+    async def readScanAsync(self, executor=None):
+        """readScan() for the event loop, run in `executor` (the loop's
+        default when None). Every transport keeps to its one connection,
+        so READ? always follows the configuration written before it.
+        """
+        return await asyncio.get_running_loop().run_in_executor(executor, self.readScan)
+
+    def _parseScan(self, raw):
+        if raw == self._error_timeout:
+            raise KeithleyTimeout
+
+        readings = raw.split(',')
+        if len(readings) != len(self._scan_channels):
+            raise KeithleyBadData
+
+        values = {}
+        for channel, reading in zip(self._scan_channels, readings):
+            match = self._reading_pattern.match(reading)
+            if match is None:
+                raise KeithleyBadData
+            values[channel] = float(match.group(1))
+
+        return values
+
 if __name__ == '__main__':
     k = Keithley(comm="COM6")
     temp = k.channel[18].getTemperature()
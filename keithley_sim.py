@@ -0,0 +1,189 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from threading import BoundedSemaphore, Thread, Lock
+from time import sleep
+from socket import SHUT_RDWR
+
+class FakeKeithleySCPI():
+    """Answers the subset of SCPI that keithley.py sends.
+
+    Readings are deterministic: channel n reads 1 + n/10 volts DC or
+    20 + n/10 degrees unless overridden in `values`. `reading_time` is
+    slept once per reading to stand in for the meter's conversion time.
+    Readings carry their units until FORMat:ELEMents leaves UNIT out, as
+    on the meter.
+    """
+
+    def __init__(self, values=None, reading_time=0.0):
+        self.values = dict(values or {})
+        self.reading_time = reading_time
+        self.functions = {}
+        self.scan = []
+        self.elements = {'READ', 'UNIT'}
+        self.commands = 0
+        self._lock = Lock()
+
+    def _value(self, channel, function):
+        if channel in self.values:
+            return self.values[channel]
+        if function == 'TEMP':
+            return 20.0 + channel / 10.0
+        return 1.0 + channel / 10.0
+
+    def _reading(self, channel, function):
+        if self.reading_time:
+            sleep(self.reading_time)
+        units = ''
+        if 'UNIT' in self.elements:
+            units = {'TEMP': 'C', 'VOLT:AC': 'VAC'}.get(function, 'VDC')
+        return '%+.6E%s' % (self._value(channel, function), units)
+
+    @staticmethod
+    def _channels(text):
+        channels = []
+        start = text.find('(@')
+        if start < 0:
+            return channels
+        for item in text[start + 2:text.find(')', start)].split(','):
+            if ':' in item:
+                first, last = item.split(':')
+                channels.extend(range(int(first) % 100, int(last) % 100 + 1))
+            elif item.strip():
+                channels.append(int(item) % 100)
+        return channels
+
+    @staticmethod
+    def _matches(header, short_form):
+        parts = header.split(':')
+        shorts = short_form.split(':')
+        if len(parts) != len(shorts):
+            return False
+        return all(p.startswith(s) for p, s in zip(parts, shorts))
+
+    def handle(self, command):
+        """Return the reply text for a query, or None for a setting."""
+        command = command.strip()
+        header, _, args = command.partition(' ')
+        header = header.upper()
+        with self._lock:
+            self.commands += 1
+            if header == '*IDN?':
+                return 'KEITHLEY INSTRUMENTS INC.,MODEL 2701,0,SIM'
+            if self._matches(header, 'MEAS:VOLT:DC?'):
+                return ','.join(self._reading(ch, 'VOLT:DC') for ch in self._channels(args))
+            if self._matches(header, 'MEAS:VOLT:AC?'):
+                return ','.join(self._reading(ch, 'VOLT:AC') for ch in self._channels(args))
+            if self._matches(header, 'MEAS:TEMP?'):
+                return ','.join(self._reading(ch, 'TEMP') for ch in self._channels(args))
+            if self._matches(header, 'SENS:FUNC'):
+                function = 'TEMP' if 'TEMP' in args.upper() else 'VOLT:DC'
+                for ch in self._channels(args):
+                    self.functions[ch] = function
+                return None
+            if self._matches(header, 'FORM:ELEM'):
+                self.elements = {item.strip().upper()[:4] for item in args.split(',')}
+                return None
+            if self._matches(header, 'ROUT:SCAN'):
+                self.scan = self._channels(args)
+                return None
+            if header == 'READ?':
+                return ','.join(self._reading(ch, self.functions.get(ch, 'VOLT:DC'))
+                                for ch in self.scan)
+            if header.endswith('?'):
+                return '0'
+            return None
+
+class _FakeServerMixin():
+
+    def start(self):
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.server_address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        for client in list(self.clients):
+            try:
+                client.shutdown(SHUT_RDWR)
+            except OSError:
+                pass
+
+class _FakeKeithleyHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+        self.server.clients.add(self.connection)
+
+    def finish(self):
+        super().finish()
+        self.server.clients.discard(self.connection)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        command = parse_qs(url.query).get('cmd', [''])[0]
+        reply = self.server.scpi.handle(command) or ''
+        body = ('<html><body>%s</body></html>' % reply).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeKeithleyHTTPServer(_FakeServerMixin, ThreadingHTTPServer):
+    """Local stand-in for the meter's scpi_response.html page."""
+    daemon_threads = True
+
+    def __init__(self, scpi=None, address=('127.0.0.1', 0)):
+        super().__init__(address, _FakeKeithleyHTTPHandler)
+        self.scpi = scpi or FakeKeithleySCPI()
+        self.connections = 0
+        self.clients = set()
+        self._thread = None
+
+
+class _FakeKeithleySocketHandler(StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        # Like the meter, serve a limited number of clients at once; a
+        # client over the limit waits briefly for one to go, then is
+        # disconnected.
+        if self.server.slots is not None and not self.server.slots.acquire(timeout=1.0):
+            self.server.refused += 1
+            return
+        self.server.connections += 1
+        self.server.clients.add(self.connection)
+        try:
+            for line in self.rfile:
+                reply = self.server.scpi.handle(line.decode('utf-8'))
+                if reply is not None:
+                    self.wfile.write(b'%s\n' % reply.encode('utf-8'))
+        except OSError:
+            pass
+        finally:
+            self.server.clients.discard(self.connection)
+            if self.server.slots is not None:
+                self.server.slots.release()
+
+class FakeKeithleySocketServer(_FakeServerMixin, ThreadingTCPServer):
+    """Loopback stand-in for the meter's raw SCPI socket, which takes one
+    client at a time unless `max_clients` says otherwise (None: no limit)."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, scpi=None, address=('127.0.0.1', 0), max_clients=1):
+        super().__init__(address, _FakeKeithleySocketHandler)
+        self.scpi = scpi or FakeKeithleySCPI()
+        self.slots = None if max_clients is None else BoundedSemaphore(max_clients)
+        self.refused = 0
+        self.connections = 0
+        self.clients = set()
+        self._thread = None
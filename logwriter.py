@@ -0,0 +1,248 @@
+import os
+import sys
+import time
+
+def _converted_columns(columns, conversions):
+    # [(converted column name, raw column index, Conversion)] in column order.
+    if not conversions:
+        return []
+    from conversions import converted_column
+
+    return [(converted_column(column, conversions[column]), i, conversions[column])
+            for i, column in enumerate(columns) if column in conversions]
+
+class CsvLogWriter():
+    """Append-only CSV log written as the run goes.
+
+    The header matches what DataFrame.to_csv produces for the logger's
+    MultiIndex columns (see thing.csv), so existing analysis keeps working.
+    Rows are buffered until `flush_rows` have accumulated and then written
+    in one go. `fsync_interval` controls durability: None never fsyncs,
+    0 fsyncs on every flush and a positive value fsyncs at most that
+    many seconds apart. `conversions` maps raw columns to Conversions;
+    each converted column is written after the raw ones, computed a whole
+    block at a time.
+
+    An existing log is appended to only if its header matches, and its
+    row numbers carry on; otherwise it is left alone and the log goes to
+    the first free '<name>-<n>.csv' instead, which `path` then holds.
+    """
+
+    def __init__(self, path, columns, flush_rows=1, fsync_interval=0, conversions=None):
+        self.path = path
+        self.columns = list(columns)
+        self._converted = _converted_columns(self.columns, conversions)
+        self.header = self.columns + [name for name, i, conversion in self._converted]
+        self.flush_rows = flush_rows
+        self.fsync_interval = fsync_interval
+        self._buffer = []
+        self._last_fsync = time.monotonic()
+        self._row_offset = 0
+        self.path = self._find_log(path)
+        self._file = open(self.path, 'a', newline='')
+        if self._file.tell() == 0:
+            self._write_header()
+        elif not self._ends_with_newline(self.path):
+            # A run that died mid-row left half a line; end it there.
+            self._file.write('\n')
+
+    def _header_lines(self):
+        if all(isinstance(column, tuple) for column in self.header):
+            levels = zip(*self.header)
+        else:
+            levels = [self.header]
+        return [','.join([''] + [self._escape(str(name)) for name in level]) for level in levels]
+
+    def _write_header(self):
+        for line in self._header_lines():
+            self._file.write(line + '\n')
+        self._sync(force=True)
+
+    def _find_log(self, path):
+        header = self._header_lines()
+        stem, extension = os.path.splitext(path)
+        candidate = path
+        n = 0
+        while os.path.exists(candidate) and os.path.getsize(candidate):
+            with open(candidate, newline='') as f:
+                existing = [f.readline().rstrip('\r\n') for _ in header]
+            if existing == header:
+                self._row_offset = self._last_row_number(candidate)
+                break
+            n += 1
+            candidate = '%s-%d%s' % (stem, n, extension)
+        if candidate != path:
+            print('%s has different columns, logging to %s' % (path, candidate),
+                  file=sys.stderr)
+        return candidate
+
+    @staticmethod
+    def _ends_with_newline(path):
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    @staticmethod
+    def _last_row_number(path):
+        # Row number of the last data row, from the end of the file. A row
+        # torn off at the end (text after the last newline) still used up
+        # the number after the last complete row, even if its own number
+        # was cut short, so it is counted.
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 65536))
+            lines = f.read().split(b'\n')
+        torn = int(lines[-1] != b'')
+        for line in reversed(lines[:-1]):
+            try:
+                return int(line.split(b',', 1)[0]) + torn
+            except ValueError:
+                continue
+        return torn
+
+    @staticmethod
+    def _escape(text):
+        if any(c in text for c in ',"\n'):
+            return '"%s"' % text.replace('"', '""')
+        return text
+
+    @property
+    def buffered_rows(self):
+        return len(self._buffer)
+
+    def write_store(self, store):
+        """Write every row held in `store` and then clear it."""
+        for first_row, values, valid in store.blocks():
+            columns = [v.tolist() for v in values]
+            masks = valid.tolist()
+            for name, i, conversion in self._converted:
+                columns.append(conversion(values[i]).tolist())
+                masks.append(masks[i])
+            for r in range(len(values[0]) if values else 0):
+                cells = [str(first_row + r + self._row_offset)]
+                for c, column in enumerate(columns):
+                    cells.append(str(column[r]) if masks[c][r] else '')
+                self._buffer.append(','.join(cells) + '\n')
+        store.clear()
+        if len(self._buffer) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(''.join(self._buffer))
+            self._buffer.clear()
+        self._sync()
+
+    def _sync(self, force=False):
+        self._file.flush()
+        if self.fsync_interval is None and not force:
+            return
+        now = time.monotonic()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    def close(self):
+        self.flush()
+        self._sync(force=True)
+        self._file.close()
+
+class EventLogWriter():
+    """Timestamped run events, such as adapters attaching or detaching,
+    appended to a small CSV beside the data log and synced as written
+    since they are rare."""
+
+    header = ('Unix', 'event', 'adapter', 'detail')
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', newline='')
+        if self._file.tell() == 0:
+            self._file.write(','.join(self.header) + '\n')
+
+    def write(self, event, adapter='', detail='', timestamp=None):
+        cells = [repr(time.time() if timestamp is None else timestamp), event, adapter, detail]
+        self._file.write(','.join(CsvLogWriter._escape(str(cell)) for cell in cells) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+class ArrowLogWriter():
+    """Columnar log written as Arrow IPC stream batches or Parquet row groups.
+
+    Column tuples are flattened to 'serial/telemetry' names. With
+    format='arrow' every batch is complete on disk once written, so a
+    crash loses at most the rows still buffered; Parquet files are only
+    readable after close() writes the footer. Converted columns, as in
+    CsvLogWriter, are float64. Needs pyarrow.
+    """
+
+    def __init__(self, path, columns, dtypes=None, rows_per_batch=60, format='arrow',
+                 conversions=None):
+        import pyarrow as pa
+
+        self._pa = pa
+        self.path = path
+        self.columns = list(columns)
+        self._converted = _converted_columns(self.columns, conversions)
+        self.rows_per_batch = rows_per_batch
+        dtypes = dtypes or {}
+        header = self.columns + [name for name, i, conversion in self._converted]
+        names = ['row'] + ['/'.join(map(str, c)) if isinstance(c, tuple) else str(c)
+                           for c in header]
+        types = [pa.int64()] + [pa.from_numpy_dtype(dtypes.get(c, 'float64'))
+                                for c in self.columns] + [pa.float64()] * len(self._converted)
+        self.schema = pa.schema(list(zip(names, types)))
+        self._pending = []
+        self._pending_rows = 0
+        if format == 'arrow':
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = pa.ipc.new_stream(self._sink, self.schema)
+        elif format == 'parquet':
+            import pyarrow.parquet as pq
+
+            self._sink = None
+            self._writer = pq.ParquetWriter(path, self.schema)
+        else:
+            raise ValueError('unknown log format %r' % format)
+
+    @property
+    def buffered_rows(self):
+        return self._pending_rows
+
+    def write_store(self, store):
+        """Queue every row held in `store` and then clear it."""
+        pa = self._pa
+        for first_row, values, valid in store.blocks():
+            n = len(values[0]) if values else 0
+            arrays = [pa.array(range(first_row, first_row + n), pa.int64())]
+            for column, mask in zip(values, valid):
+                arrays.append(pa.array(column.copy(), mask=~mask))
+            for name, i, conversion in self._converted:
+                arrays.append(pa.array(conversion(values[i]), mask=~valid[i]))
+            self._pending.append(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+            self._pending_rows += n
+        store.clear()
+        if self._pending_rows >= self.rows_per_batch:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        table = self._pa.Table.from_batches(self._pending, self.schema)
+        if self._sink is None:
+            self._writer.write_table(table)
+        else:
+            for batch in table.combine_chunks().to_batches():
+                self._writer.write_batch(batch)
+            self._sink.flush()
+        self._pending.clear()
+        self._pending_rows = 0
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
@@ -0,0 +1,151 @@
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+def format_metrics(families):
+    """Render (name, type, help, samples) families in the Prometheus text
+    format, where samples is a list of ({label: value}, number)."""
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in samples:
+            if value is None:
+                continue
+            if labels:
+                label_text = ','.join('%s="%s"' % (k, _escape(v)) for k, v in labels.items())
+                lines.append('%s{%s} %r' % (name, label_text, float(value)))
+            else:
+                lines.append('%s %r' % (name, float(value)))
+    return '\n'.join(lines) + '\n'
+
+class AcquisitionMetrics():
+    """Live figures from the running logger, read when scraped.
+
+    main() fills in what exists for the run: the AcquisitionEngine, the
+    adapter instances, the store and writer, the Keithley, the device
+    guards and, with --processes, the AdapterProcessPool. Everything is
+    read without locks from plain attributes, so a scrape never waits on
+    acquisition.
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.last_sample_time = None
+        self.engine = None
+        self.instances = {}
+        self.store = None
+        self.writer = None
+        self.keithley = None
+        self.pool = None
+        self.guards = {}
+
+    def cycle_done(self, n):
+        self.last_sample_time = time.time()
+
+    def collect(self):
+        now = time.time()
+        engine = self.engine
+        families = [
+            ('thermallogger_uptime_seconds', 'gauge', 'Seconds since the logger started.',
+             [({}, now - self.start_time)]),
+            ('thermallogger_last_sample_age_seconds', 'gauge',
+             'Seconds since the last row was stored.',
+             [({}, None if self.last_sample_time is None else now - self.last_sample_time)]),
+        ]
+        if engine is not None:
+            families += [
+                ('thermallogger_cycles_total', 'counter', 'Acquisition cycles run.',
+                 [({}, engine.cycles)]),
+                ('thermallogger_missed_deadlines_total', 'counter',
+                 'Cycle deadlines skipped because a cycle overran.',
+                 [({}, engine.missed_deadlines)]),
+                ('thermallogger_cycle_period_seconds', 'gauge', 'Configured base cycle period.',
+                 [({}, engine.period)]),
+                ('thermallogger_last_cycle_seconds', 'gauge', 'Duration of the last cycle.',
+                 [({}, engine.last_cycle_time)]),
+            ]
+
+        errors = [({'adapter': serial_number, 'kind': 'short_read'}, instance.get('errors', 0))
+                  for serial_number, instance in self.instances.items()]
+        if self.pool is not None:
+            errors += [({'adapter': serial_number, 'kind': 'missed_sample'}, count)
+                       for serial_number, count in self.pool.missed_samples.items()]
+        families.append(('thermallogger_adapter_errors_total', 'counter',
+                         'Telemetry reads lost per adapter.', errors))
+        if self.pool is None:
+            families.append(('thermallogger_adapter_attached', 'gauge',
+                             '1 while the adapter is attached, 0 while it is missing.',
+                             [({'adapter': serial_number}, instance['handle'] is not None)
+                              for serial_number, instance in self.instances.items()]))
+
+        if self.guards:
+            families += [
+                ('thermallogger_device_status', 'gauge',
+                 'Last cycle status: 0 ok, 1 failed, 2 skipped by the breaker, 3 detached.',
+                 [({'device': name}, guard.status) for name, guard in self.guards.items()]),
+                ('thermallogger_breaker_opened_total', 'counter',
+                 'Times a device was cut off after repeated failures.',
+                 [({'device': name}, guard.breaker.opened)
+                  for name, guard in self.guards.items()]),
+            ]
+
+        depths = []
+        if self.store is not None:
+            depths.append(({'queue': 'store'}, len(self.store)))
+        if self.writer is not None:
+            depths.append(({'queue': 'writer'}, self.writer.buffered_rows))
+        if self.pool is not None:
+            depths.append(({'queue': 'process_pool'}, self.pool.pending_samples))
+        families.append(('thermallogger_queue_depth', 'gauge',
+                         'Rows or samples waiting to be written or merged.', depths))
+
+        if self.keithley is not None:
+            families.append(('thermallogger_keithley_last_rtt_seconds', 'gauge',
+                             'Round trip of the last Keithley query.',
+                             [({}, self.keithley.last_rtt)]))
+        return families
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = format_metrics(self.server.collect()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serve `collect()` as /metrics from a background thread.
+
+    Binds to localhost by default; port 0 picks a free port, returned by
+    start().
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, collect, address=('127.0.0.1', 0)):
+        super().__init__(address, _MetricsHandler)
+        self.collect = collect
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self.serve_forever, daemon=True, name='metrics')
+        self._thread.start()
+        return self.server_address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
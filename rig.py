@@ -0,0 +1,110 @@
+"""Rig manifests and cached transaction plans, for unattended startup.
+
+A rig manifest says which product is on each Aardvark adapter, by the
+unique ID aa_find_devices_ext reports (with or without the dash), and how
+to reach the Keithley:
+
+    {
+        "keithley": {"comm": "COM3"},
+        "adapters": {
+            "2237-123456": {"serial": "EPS-001",
+                            "config": "eps thermal config.json",
+                            "keithley channels": [1, 2, 3]}
+        }
+    }
+
+The "keithley" entry holds Keithley() arguments (comm, ip or tcp, and
+optionally baud or timeout). Config paths are relative to the manifest.
+
+What an adapter needs from its device config (its transactions,
+Keithley rates and conversions) is compiled once into a plan and kept in
+a JSON file keyed by a hash of the config, so an edited config is
+recompiled and an unchanged one is loaded as is.
+"""
+import hashlib
+import json
+import os
+import sys
+
+# Bump when the same config would compile to a different plan.
+PLAN_VERSION = 2
+
+def manifest_key(unique_id):
+    return str(unique_id).replace('-', '')
+
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    root = os.path.dirname(os.path.abspath(path))
+    adapters = {}
+    for unique_id, entry in manifest.get('adapters', {}).items():
+        if 'serial' not in entry or 'config' not in entry:
+            raise ValueError('adapter %s in %s needs a serial and a config' % (unique_id, path))
+        entry = dict(entry)
+        entry['serial'] = str(entry['serial'])
+        entry['config'] = os.path.join(root, entry['config'])
+        entry['keithley channels'] = [int(channel)
+                                      for channel in entry.get('keithley channels', [])]
+        adapters[manifest_key(unique_id)] = entry
+    manifest['adapters'] = adapters
+    return manifest
+
+def manifest_entry(manifest, unique_id):
+    """Return the manifest entry for an adapter, or None if it has none."""
+    return manifest['adapters'].get(manifest_key(unique_id))
+
+def missing_adapters(manifest, aardvark_list):
+    """Unique IDs in the manifest that are not among the found adapters."""
+    found = {manifest_key(unique_id) for unique_id in aardvark_list.values()}
+    return sorted(set(manifest['adapters']) - found)
+
+def config_hash(config):
+    with open(config, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class PlanCache():
+    """Compiled plans in a JSON file, keyed by config file hash.
+
+    get() returns the cached plan for a config, or builds it with
+    build(config), which must return plain JSON data, and keeps it.
+    save() writes back only the plans used since loading, so plans for
+    old versions of a config do not pile up. An unreadable or outdated
+    cache file is ignored and rebuilt.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._plans = self._load()
+        self._used = {}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print('ignoring plan cache %s: %s' % (self.path, e), file=sys.stderr)
+            return {}
+        if not isinstance(cached, dict) or cached.get('version') != PLAN_VERSION:
+            return {}
+        return cached['plans']
+
+    def get(self, config, build):
+        key = config_hash(config)
+        plan = self._used.get(key)
+        if plan is None:
+            plan = self._plans.get(key)
+            if plan is None:
+                plan = build(config)
+            self._used[key] = plan
+        return plan
+
+    def save(self):
+        if self._used.keys() == self._plans.keys():
+            return
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'version': PLAN_VERSION, 'plans': self._used}, f)
+        os.replace(temporary, self.path)
+        self._plans = dict(self._used)
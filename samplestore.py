@@ -0,0 +1,147 @@
+from time import perf_counter
+import numpy as np
+
+class SampleStore():
+    """Typed column store for logged samples.
+
+    Each column is a NumPy array of its own dtype with a parallel validity
+    mask, allocated in fixed-size chunks. Appending a row writes into the
+    current chunk and only allocates when a chunk fills, so the cost of a
+    cycle does not depend on how many rows are already stored.
+    """
+
+    def __init__(self, columns, dtypes=None, chunk_rows=4096):
+        dtypes = dtypes or {}
+        self.columns = list(columns)
+        self._dtypes = [np.dtype(dtypes.get(col, np.float64)) for col in self.columns]
+        self._index = {col: i for i, col in enumerate(self.columns)}
+        self._chunk_rows = chunk_rows
+        self._chunks = []
+        self._rows = 0
+        self._first_row = 1
+
+    def __len__(self):
+        return self._rows
+
+    def _new_chunk(self):
+        values = []
+        for dtype in self._dtypes:
+            if dtype.kind == 'f':
+                values.append(np.full(self._chunk_rows, np.nan, dtype))
+            else:
+                values.append(np.zeros(self._chunk_rows, dtype))
+        valid = np.zeros((len(self.columns), self._chunk_rows), bool)
+        return values, valid
+
+    # Opt-in, called as latency_hook(store, seconds) after each append.
+    latency_hook = None
+
+    def append(self, row):
+        """Store one row given as {column: value}; absent columns are invalid."""
+        if self.latency_hook is None:
+            return self._append(row)
+        start = perf_counter()
+        row_number = self._append(row)
+        self.latency_hook(self, perf_counter() - start)
+        return row_number
+
+    def _append(self, row):
+        chunk, pos = divmod(self._rows, self._chunk_rows)
+        if chunk == len(self._chunks):
+            self._chunks.append(self._new_chunk())
+        values, valid = self._chunks[chunk]
+        index = self._index
+        for column, value in row.items():
+            i = index[column]
+            values[i][pos] = value
+            valid[i, pos] = True
+        self._rows += 1
+        return self._first_row + self._rows - 1
+
+    def column(self, column):
+        """Return (values, valid) for one column across every chunk."""
+        i = self._index[column]
+        parts = [(values[i][:n], valid[i, :n]) for (values, valid), n in self._chunk_lengths()]
+        if not parts:
+            return np.empty(0, self._dtypes[i]), np.empty(0, bool)
+        return (np.concatenate([p[0] for p in parts]),
+                np.concatenate([p[1] for p in parts]))
+
+    def _chunk_lengths(self):
+        for chunk, arrays in enumerate(self._chunks):
+            n = min(self._chunk_rows, self._rows - chunk * self._chunk_rows)
+            if n > 0:
+                yield arrays, n
+
+    def blocks(self):
+        """Yield (first_row, values, valid) views of each filled chunk."""
+        start = self._first_row
+        for (values, valid), n in self._chunk_lengths():
+            yield start, [v[:n] for v in values], valid[:, :n]
+            start += n
+
+    @property
+    def dtypes(self):
+        return dict(zip(self.columns, self._dtypes))
+
+    def _export_columns(self, conversions):
+        # Stored columns plus (name, raw index, Conversion) for each converted one.
+        converted = []
+        if conversions:
+            from conversions import converted_column
+
+            converted = [(converted_column(column, conversions[column]), i, conversions[column])
+                         for i, column in enumerate(self.columns) if column in conversions]
+        return self.columns + [name for name, i, conversion in converted], converted
+
+    def frames(self, conversions=None):
+        """Yield one DataFrame per chunk, viewing the stored arrays without copying.
+
+        `conversions` maps columns to Conversions; each converted column is
+        added after the raw ones, NaN where the raw value is missing.
+        """
+        import pandas as pd
+
+        columns, converted = self._export_columns(conversions)
+        start = self._first_row
+        for (values, valid), n in self._chunk_lengths():
+            data = {}
+            for i, column in enumerate(self.columns):
+                if self._dtypes[i].kind == 'f':
+                    data[column] = values[i][:n]
+                else:
+                    data[column] = pd.arrays.IntegerArray(values[i][:n], ~valid[i, :n])
+            for name, i, conversion in converted:
+                data[name] = np.where(valid[i, :n], conversion(values[i][:n]), np.nan)
+            index = pd.RangeIndex(start, start + n)
+            frame = pd.DataFrame(data, index=index, columns=columns, copy=False)
+            if all(isinstance(column, tuple) for column in columns):
+                frame.columns = pd.MultiIndex.from_tuples(columns)
+            yield frame
+            start += n
+
+    def to_frame(self, conversions=None):
+        import pandas as pd
+
+        frames = list(self.frames(conversions))
+        if not frames:
+            columns, converted = self._export_columns(conversions)
+            frame = pd.DataFrame(columns=columns)
+            if all(isinstance(column, tuple) for column in columns):
+                frame.columns = pd.MultiIndex.from_tuples(columns)
+            return frame
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames)
+
+    def clear(self):
+        """Drop stored rows but keep numbering, e.g. after they have been written out."""
+        used = min(self._rows, self._chunk_rows)
+        self._first_row += self._rows
+        self._rows = 0
+        self._chunks = self._chunks[:1]
+        if self._chunks:
+            values, valid = self._chunks[0]
+            valid[:, :used] = False
+            for i, dtype in enumerate(self._dtypes):
+                values[i][:used] = np.nan if dtype.kind == 'f' else 0
@@ -0,0 +1,56 @@
+import sys
+from math import isclose
+
+DEFAULT_PERIOD = 10.0
+
+def parse_rate(entry):
+    """Pull the optional 'period' (seconds) or 'decimation' out of a config entry."""
+    if not isinstance(entry, dict):
+        return {}
+    rate = {}
+    if entry.get('period') is not None:
+        rate['period'] = float(entry['period'])
+    if entry.get('decimation') is not None:
+        rate['decimation'] = int(entry['decimation'])
+    return rate
+
+class MultiRateScheduler():
+    """Decide which columns are due on each tick of the acquisition engine.
+
+    `rates` maps a column key to {'period': seconds} or {'decimation': n}
+    (or {} for the default period). The engine ticks at the fastest
+    configured period and each column is read on every n-th tick, n being
+    its period over that base tick. A decimation counts default periods,
+    not ticks, so adding a faster code elsewhere leaves it alone. Periods
+    that are not a whole number of ticks are rounded to one and reported
+    through `on_rounded(period, actual, keys)`.
+    """
+
+    def __init__(self, rates, default_period=DEFAULT_PERIOD, on_rounded=None):
+        periods = [rate['period'] for rate in rates.values() if rate.get('period')]
+        self.base_period = min(periods + [default_period])
+        self.on_rounded = on_rounded or self._report_rounded
+        self.decimation = {}
+        rounded = {}
+        for key, rate in rates.items():
+            if rate.get('decimation'):
+                period = rate['decimation'] * default_period
+            else:
+                period = rate.get('period') or default_period
+            ticks = max(1, round(period / self.base_period))
+            if not isclose(ticks * self.base_period, period):
+                rounded.setdefault(period, []).append(key)
+            self.decimation[key] = ticks
+        for period, keys in rounded.items():
+            self.on_rounded(period, self.decimation[keys[0]] * self.base_period, keys)
+
+    def _report_rounded(self, period, actual, keys):
+        print('%g s is not a multiple of the %g s tick, reading %d column(s) such as %s '
+              'every %g s instead' % (period, self.base_period, len(keys), keys[0], actual),
+              file=sys.stderr)
+
+    def is_due(self, key, tick):
+        return tick % self.decimation.get(key, 1) == 0
+
+    def due(self, keys, tick):
+        return [key for key in keys if self.is_due(key, tick)]
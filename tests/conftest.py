@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import thermallogger as tl
+from aardvark import aardvark_py3 as aa
+from aardvark.simulator import SimulatedAardvarkApi, SimulatedAdapter, devices_from_config
+
+DEVICE_CONFIG = {
+    'devices': {
+        'EPS': {
+            'Address': '0x2B',
+            'TLE codes': {
+                'VPCM3V3': {'code': '0xE200', 'conversion': {'scale': 0.001, 'unit': 'V'}},
+                'IPCM3V3': '0xE204',
+                'TEMP': {'code': '0xE210', 'signed': True},
+                'COUNT': {'code': '0xE214', 'width': 4},
+                'FLAGS': {'code': '0xE220', 'width': 2, 'endian': 'little'},
+            },
+        },
+    },
+}
+
+SIM_VALUES = {'VPCM3V3': 3650, 'IPCM3V3': 12, 'TEMP': -40, 'COUNT': 70000, 'FLAGS': 0x0102}
+
+@pytest.fixture
+def device_config(tmp_path):
+    path = tmp_path / 'device config.json'
+    path.write_text(json.dumps(DEVICE_CONFIG))
+    return str(path)
+
+def make_sim_api(config, adapters=1, nack_rate=0.0, **kwargs):
+    kwargs.setdefault('usb_latency_ms', 0)
+    return SimulatedAardvarkApi(
+        [SimulatedAdapter(2237000000 + i, devices_from_config(config, 0.5, nack_rate, SIM_VALUES))
+         for i in range(adapters)], **kwargs)
+
+def open_instances(config):
+    """An opened instance, 'SN<port>', for each adapter the backend lists,
+    wired to Keithley channel port + 1."""
+    return {'SN%d' % port: tl.create_instance({'config': config, 'keithley channels': [port + 1]},
+                                              port, unique_id, tl.open_aardvark(port))
+            for port, unique_id in tl.create_aardvark_list().items()}
+
+@pytest.fixture
+def sim_api(device_config):
+    """Two simulated adapters behind the aa_* functions."""
+    api = make_sim_api(device_config, adapters=2)
+    previous = aa.aa_set_backend(api)
+    yield api
+    aa.aa_set_backend(previous)
+
+@pytest.fixture
+def instances(sim_api, device_config):
+    return open_instances(device_config)
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import thermallogger as tl
+from adapterprocess import AdapterProcessPool, SampleRing
+from conftest import SIM_VALUES
+
+PERIOD = 0.4
+
+@pytest.fixture
+def ring():
+    writer = SampleRing(3, slots=4)
+    reader = SampleRing(3, slots=4, name=writer.name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+def write_cycle(writer, cycle):
+    writer.write(cycle, 1000.0 + cycle, np.full(3, float(cycle)), [True, cycle % 2 == 0, True])
+
+def test_ring_round_trip(ring):
+    writer, reader = ring
+    write_cycle(writer, 0)
+    write_cycle(writer, 1)
+    samples = reader.read()
+    assert [(cycle, timestamp) for cycle, timestamp, _, _ in samples] == [(0, 1000.0), (1, 1001.0)]
+    assert samples[1][2].tolist() == [1.0, 1.0, 1.0]
+    assert samples[1][3].tolist() == [True, False, True]
+    assert reader.read() == []
+
+def test_reader_a_ring_behind_gets_the_newest(ring):
+    writer, reader = ring
+    for cycle in range(7):
+        write_cycle(writer, cycle)
+    assert [sample[0] for sample in reader.read()] == [3, 4, 5, 6]
+
+def test_slot_being_rewritten_is_skipped(ring):
+    writer, reader = ring
+    for cycle in range(4):
+        write_cycle(writer, cycle)
+    # Write 4 has started on slot 0 (odd sequence) but not finished.
+    writer._sequence[0] = 2 * 4 + 1
+    writer._data[0, 2:] = 4.0
+    assert [sample[0] for sample in reader.read()] == [1, 2, 3]
+
+def test_concurrent_reads_are_never_torn():
+    writer = SampleRing(64, slots=4)
+    reader = SampleRing(64, slots=4, name=writer.name)
+    stop = threading.Event()
+
+    def write():
+        cycle = 0
+        while not stop.is_set():
+            writer.write(cycle, cycle, np.full(64, float(cycle)), np.full(64, cycle % 2 == 0))
+            cycle += 1
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 0.3
+        seen = 0
+        while time.monotonic() < deadline:
+            for cycle, timestamp, values, valid in reader.read():
+                assert timestamp == cycle
+                assert (values == cycle).all()
+                assert (valid == (cycle % 2 == 0)).all()
+                seen += 1
+        assert seen
+    finally:
+        stop.set()
+        thread.join()
+        reader.close()
+        writer.close()
+
+def test_pool_cycles_line_up_with_collect(device_config, monkeypatch):
+    # The workers are spawned, so they load the simulator from the environment.
+    monkeypatch.setenv('AARDVARK_BACKEND', 'sim')
+    monkeypatch.setenv('AARDVARK_SIM_CONFIG', device_config)
+    monkeypatch.setenv('AARDVARK_SIM_USB_MS', '0')
+    monkeypatch.setenv('AARDVARK_SIM_SETTLE_MS', '0.5')
+    instances = {'SN0': tl.create_instance({'config': device_config, 'keithley channels': []},
+                                           0, 2237000000)}
+    for instance in instances.values():
+        instance['Transactions'] = [t.replace(delay=2) for t in instance['Transactions']]
+    pool = AdapterProcessPool(instances, PERIOD)
+    start_time = pool.start(time.monotonic() + 2.0)
+    try:
+        rows = []
+        for cycle in range(3):
+            time.sleep(max(0, start_time + cycle * PERIOD - time.monotonic()))
+            rows.append(pool.collect(cycle, PERIOD / 2))
+    finally:
+        pool.stop()
+    assert rows[1][('SN0', 'VPCM3V3')] == SIM_VALUES['VPCM3V3']
+    assert all(len(row) == 5 for row in rows)
+    assert pool.missed_samples == {'SN0': 0}
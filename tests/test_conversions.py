@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conversions import (Conversion, convert_frame, converted_column, conversion_settings,
+                         load_conversions)
+from conftest import DEVICE_CONFIG
+
+def test_scale():
+    conversion = Conversion(scale=0.5, offset=-1, unit='V')
+    assert conversion(np.array([0, 2, 4096])).tolist() == [-1.0, 0.0, 2047.0]
+    assert conversion.column_name('VBAT') == 'VBAT [V]'
+
+def test_poly():
+    conversion = Conversion(poly=[1, 2, 3])
+    assert conversion([0, 1, 2]).tolist() == [1.0, 6.0, 17.0]
+    assert conversion.column_name('T') == 'T [eng]'
+
+def test_table_interpolates_and_clamps():
+    conversion = Conversion(table=[[100, 10], [0, 0], [200, 40]], unit='C')
+    assert conversion([-5, 0, 50, 150, 200, 999]).tolist() == [0, 0, 5, 25, 40, 40]
+
+def test_nan_stays_nan():
+    assert np.isnan(Conversion(scale=2)([np.nan])[0])
+    assert np.isnan(Conversion(poly=[1, 1])([np.nan])[0])
+
+@pytest.mark.parametrize('settings', [{}, {'scale': 1, 'poly': [0, 1]}, {'unit': 'V'}])
+def test_needs_exactly_one_kind(settings):
+    with pytest.raises(ValueError):
+        Conversion(**settings)
+
+def test_from_config():
+    assert Conversion.from_config('0xE200') is None
+    assert Conversion.from_config({'code': '0xE200'}) is None
+    assert Conversion.from_config({'code': '0xE200', 'conversion': {'poly': [0, 1]}}).kind == 'poly'
+    assert conversion_settings(DEVICE_CONFIG) == {'VPCM3V3': {'scale': 0.001, 'unit': 'V'}}
+    assert load_conversions(DEVICE_CONFIG)['VPCM3V3'](3650) == pytest.approx(3.65)
+
+def test_convert_frame():
+    conversions = load_conversions(DEVICE_CONFIG)
+    column = ('SN0', 'VPCM3V3')
+    frame = pd.DataFrame({column: [3650, None], ('SN0', 'TEMP'): [1, 2]})
+    convert_frame(frame, {column: conversions['VPCM3V3'],
+                          ('SN1', 'VPCM3V3'): conversions['VPCM3V3']})
+    converted = converted_column(column, conversions['VPCM3V3'])
+    assert converted == ('SN0', 'VPCM3V3 [V]')
+    assert frame[converted].iloc[0] == pytest.approx(3.65)
+    assert np.isnan(frame[converted].iloc[1])
+    assert ('SN1', 'VPCM3V3 [V]') not in frame.columns
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from aardvark.wrapper import I2CTransaction
+from decode import TelemetryDecoder, column_dtype, decode_reply, parse_format
+
+def transaction(name, width=2, **options):
+    return I2CTransaction(0x2B, 0x10, 0xE200, bytes_to_read=width, name=name, **options)
+
+TRANSACTIONS = [
+    transaction('u8', 1),
+    transaction('u16'),
+    transaction('s16', signed=True),
+    transaction('le16', endian='little'),
+    transaction('u32', 4),
+    transaction('s16b', signed=True),
+    transaction('write only', 0),
+]
+REPLIES = [b'\xff', b'\x01\x02', b'\xff\xd8', b'\x01\x02', b'\x00\x01\x11\x70', b'\x80\x00', b'']
+EXPECTED = [255, 0x0102, -40, 0x0201, 70000, -32768, 0]
+
+def run(decoder, replies, skip=(), short=(), unwritten=()):
+    # Stand in for a cycle: each run transaction gets its reply in its slot.
+    run, results = [], []
+    for i, (t, reply) in enumerate(zip(decoder.transactions, replies)):
+        if i in skip:
+            continue
+        t.reply_view[:len(reply)] = reply
+        read = len(reply) - 1 if i in short else len(reply)
+        written = len(t.message) - 1 if i in unwritten else len(t.message)
+        run.append(t)
+        results.append((t.reply_view[:read], read, written))
+    return decoder.decode(run, results)
+
+def test_mixed_formats():
+    decoder = TelemetryDecoder(TRANSACTIONS)
+    values, valid = run(decoder, REPLIES)
+    assert values.tolist() == EXPECTED
+    assert valid.tolist() == [True] * 6 + [False]
+    for t, reply, expected in zip(TRANSACTIONS[:6], REPLIES, EXPECTED):
+        assert decode_reply(t, reply) == expected
+
+def test_replies_share_one_buffer():
+    decoder = TelemetryDecoder(TRANSACTIONS)
+    assert len(decoder.buffer) == 1 + 2 + 2 + 2 + 4 + 2
+    assert all(t.fields() == original.fields()
+               for t, original in zip(decoder.transactions, TRANSACTIONS))
+
+def test_validity_mask():
+    decoder = TelemetryDecoder(TRANSACTIONS)
+    values, valid = run(decoder, REPLIES, skip={1}, short={2}, unwritten={4})
+    assert valid.tolist() == [True, False, False, True, False, True, False]
+    assert values[3] == 0x0201
+
+def test_stale_values_are_not_valid_next_cycle():
+    decoder = TelemetryDecoder(TRANSACTIONS)
+    run(decoder, REPLIES)
+    values, valid = run(decoder, REPLIES, skip={0, 1, 2, 3, 4})
+    assert valid.tolist() == [False] * 5 + [True, False]
+
+def test_parse_format():
+    assert parse_format('0xE200') == {}
+    assert parse_format({'code': '0xE200', 'width': 4, 'signed': True, 'endian': 'little'}) == \
+        {'bytes_to_read': 4, 'signed': True, 'endian': 'little'}
+    with pytest.raises(ValueError):
+        parse_format({'code': '0xE200', 'width': 3})
+    assert column_dtype(transaction('u32', 4)) == np.int64
+    assert column_dtype(transaction('u8', 1)) == np.int32
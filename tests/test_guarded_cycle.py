@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+
+import thermallogger as tl
+from breaker import STATUS_DETACHED, STATUS_FAILED, STATUS_OK, STATUS_OPEN, CircuitBreaker
+from keithley import Keithley
+from keithley_sim import FakeKeithleySocketServer
+
+DEADLINE = 0.1
+FAILURES = 2
+BACKOFF = 0.3
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_breaker_opens_and_backs_off():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=2, backoff=1.0, max_backoff=3.0, clock=clock)
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.allow()
+    assert breaker.opened == 1
+
+    clock.now = 1.0
+    assert breaker.state == 'half-open' and breaker.allow()
+    breaker.record(False)
+    clock.now = 2.5
+    assert not breaker.allow()
+    clock.now = 3.0
+    assert breaker.allow()
+    breaker.record(False)
+    clock.now = 5.9
+    assert not breaker.allow()   # doubled again, but capped at max_backoff
+    clock.now = 6.0
+    assert breaker.allow()
+
+    breaker.record(True)
+    assert breaker.state == 'closed' and breaker.failures == 0
+    assert breaker.opened == 1
+
+@pytest.fixture
+def rig(instances):
+    for instance in instances.values():
+        # The simulated devices settle in 0.5 ms, well inside 2 ms.
+        instance['Transactions'] = [t.replace(delay=2) for t in instance['Transactions']]
+    server = FakeKeithleySocketServer()
+    keithley = Keithley(tcp='%s:%d' % server.start())
+    tl.configure_keithley_scan(keithley, instances)
+    executor = tl.create_executor(instances)
+    yield instances, keithley, server, executor
+    executor.shutdown()
+    keithley.close()
+    server.stop()
+
+class HungWrites():
+    """Make every I2C write to one adapter take `seconds` longer."""
+
+    def __init__(self, api, handle, seconds):
+        self.handle = handle
+        self.seconds = seconds
+        self._write = api.c_aa_i2c_write
+        api.c_aa_i2c_write = self
+
+    def __call__(self, aardvark, *args):
+        if aardvark == self.handle and self.seconds:
+            time.sleep(self.seconds)
+        return self._write(aardvark, *args)
+
+async def run_cycles(rig, guards, store, cycles):
+    instances, keithley, server, executor = rig
+    statuses = []
+    for _ in range(cycles):
+        start = time.monotonic()
+        await tl.run_guarded_log_async(store, instances, keithley, executor, guards)
+        statuses.append((time.monotonic() - start,
+                         {name: guard.status for name, guard in guards.items()}))
+    return statuses
+
+def test_hung_adapter_is_cut_off(rig, sim_api):
+    instances, keithley, server, executor = rig
+    hang = HungWrites(sim_api, instances['SN1']['handle'], 0.1)
+    guards = tl.build_guards(instances, DEADLINE, DEADLINE, FAILURES, BACKOFF)
+    store = tl.build_store(instances, status=True)
+
+    async def run():
+        hung = await run_cycles(rig, guards, store, 4)
+        # Once it answers again, and the call left running has finished,
+        # the probe after the back-off closes the breaker.
+        hang.seconds = 0
+        while not guards['SN1'].pending.done():
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(BACKOFF)
+        return hung, await run_cycles(rig, guards, store, 2)
+    hung, recovered = asyncio.run(run())
+
+    for elapsed, status in hung:
+        assert elapsed < DEADLINE + 0.1
+        assert status['SN0'] == STATUS_OK
+        assert status[tl.KEITHLEY] == STATUS_OK
+    assert [status['SN1'] for _, status in hung] == [STATUS_FAILED] * FAILURES + \
+        [STATUS_OPEN] * (4 - FAILURES)
+    assert guards['SN1'].breaker.opened == 1
+    assert [status['SN1'] for _, status in recovered] == [STATUS_OK, STATUS_OK]
+    assert guards['SN1'].breaker.state == 'closed'
+
+    frame = store.to_frame()
+    assert frame[('SN0', 'VPCM3V3')].notna().all()
+    assert frame[('SN1', 'VPCM3V3')].isna().tolist() == [True] * 4 + [False] * 2
+    assert frame[('SN1', 'status')].tolist() == [status['SN1'] for _, status in hung + recovered]
+    assert frame[('SN1', '2')].notna().all()   # its Keithley channel is still read
+    assert server.connections == 1
+    assert server.refused == 0
+
+def test_detached_adapter(rig):
+    instances, keithley, server, executor = rig
+    instances['SN1']['handle'] = None
+    guards = tl.build_guards(instances, DEADLINE, DEADLINE, FAILURES, BACKOFF)
+    store = tl.build_store(instances, status=True)
+
+    statuses = asyncio.run(run_cycles(rig, guards, store, 3))
+    assert [status['SN1'] for _, status in statuses] == [STATUS_DETACHED] * 3
+    assert [status['SN0'] for _, status in statuses] == [STATUS_OK] * 3
+    assert guards['SN1'].breaker.opened == 0
@@ -0,0 +1,66 @@
+from concurrent.futures import Future
+
+import pytest
+
+import thermallogger as tl
+from breaker import CircuitBreaker, DeviceGuard
+from hotplug import AdapterWatcher
+from rig import manifest_key
+
+@pytest.fixture
+def closed(sim_api):
+    closed = []
+    close = sim_api.c_aa_close
+
+    def recording_close(aardvark):
+        closed.append(aardvark)
+        return close(aardvark)
+    sim_api.c_aa_close = recording_close
+    return closed
+
+@pytest.fixture
+def watcher(instances):
+    manifest = {'adapters': {manifest_key(instance['unique id']): {'serial': serial_number}
+                             for serial_number, instance in instances.items()}}
+    guards = {serial_number: DeviceGuard(0.1, CircuitBreaker())
+              for serial_number in instances}
+    events = []
+    watcher = AdapterWatcher(instances, manifest, tl.open_aardvark,
+                             on_event=lambda event, serial_number, instance:
+                             events.append((event, serial_number)), guards=guards)
+    watcher.events = events
+    return watcher
+
+def test_detach_and_attach(watcher, sim_api, closed):
+    handle = watcher.instances['SN1']['handle']
+    adapter = sim_api.unplug(2237000001)
+    watcher.scan()
+    assert watcher.instances['SN1']['handle'] == handle   # not until apply()
+    watcher.apply()
+    assert watcher.instances['SN1']['handle'] is None
+    assert closed == [handle]
+
+    sim_api.plug(adapter)
+    watcher.scan()
+    watcher.apply()
+    assert watcher.instances['SN1']['handle'] not in (None, handle)
+    assert watcher.instances['SN1']['port'] == 1
+    assert watcher.events == [('detached', 'SN1'), ('attached', 'SN1')]
+
+def test_handle_in_use_is_closed_once_the_call_finishes(watcher, sim_api, closed):
+    handle = watcher.instances['SN1']['handle']
+    late_call = Future()
+    watcher.guards['SN1'].pending = late_call
+    sim_api.unplug(2237000001)
+    watcher.scan()
+    watcher.apply()
+    assert watcher.instances['SN1']['handle'] is None
+    assert closed == []
+
+    watcher.apply()
+    assert closed == []
+    late_call.set_result(None)
+    watcher.apply()
+    assert closed == [handle]
+    watcher.apply()
+    assert closed == [handle]
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from keithley import Keithley, KeithleyTimeout
+from keithley_sim import FakeKeithleyHTTPServer, FakeKeithleySCPI
+
+@pytest.fixture
+def http_meter():
+    server = FakeKeithleyHTTPServer(FakeKeithleySCPI({5: -0.25}))
+    host, port = server.start()
+    keithley = Keithley(ip=host, port=port)
+    yield server, keithley
+    keithley.close()
+    server.stop()
+
+def test_single_channel_readings(http_meter):
+    server, keithley = http_meter
+    assert keithley.channel[3].getVoltageDC() == pytest.approx(1.3)
+    assert keithley.channel[3].getVoltageAC() == pytest.approx(1.3)
+    assert keithley.channel[5].getVoltageDC() == pytest.approx(-0.25)
+    assert keithley.channel[12].getTemperature() == pytest.approx(21.2)
+
+def test_scan(http_meter):
+    server, keithley = http_meter
+    keithley.configureScan(vdc_channels=[3, 5], temp_channels=[12])
+    assert server.scpi.scan == [3, 5, 12]
+    assert server.scpi.functions[12] == 'TEMP'
+    for _ in range(3):
+        assert keithley.readScan() == pytest.approx({3: 1.3, 5: -0.25, 12: 21.2})
+
+def test_readings_without_units_after_scan(http_meter):
+    server, keithley = http_meter
+    keithley.configureScan(vdc_channels=[3])
+    assert server.scpi.elements == {'READ'}
+    assert keithley.channel[3].getVoltageDC() == pytest.approx(1.3)
+
+def test_scan_is_configured_once(http_meter):
+    server, keithley = http_meter
+    keithley.configureScan(vdc_channels=[3])
+    commands = server.scpi.commands
+    keithley.configureScan(vdc_channels=[3])
+    assert server.scpi.commands == commands
+
+def test_connection_is_kept_alive(http_meter):
+    server, keithley = http_meter
+    keithley.configureScan(vdc_channels=[1, 2])
+    for _ in range(5):
+        keithley.readScan()
+    assert server.connections == 1
+
+def test_slow_reply_times_out():
+    scpi = FakeKeithleySCPI(reading_time=0.5)
+    server = FakeKeithleyHTTPServer(scpi)
+    host, port = server.start()
+    keithley = Keithley(ip=host, port=port, timeout=0.2)
+    try:
+        with pytest.raises(KeithleyTimeout):
+            keithley.channel[1].getVoltageDC()
+        scpi.reading_time = 0
+        time.sleep(0.4)   # the meter is busy until the slow reading is done
+        assert keithley.channel[1].getVoltageDC() == pytest.approx(1.1)
+    finally:
+        keithley.close()
+        server.stop()
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+import keithley
+from keithley import Keithley, KeithleyTimeout
+
+class TrickleSerial():
+    """A port whose device sends one byte of a reply just before each
+    read would time out, and never the line terminator."""
+
+    def __init__(self, port, baudrate, timeout):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.in_waiting = 0
+
+    def reset_input_buffer(self):
+        pass
+
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+    def read(self, size=1):
+        time.sleep(self.timeout * 0.9)
+        return b'1'
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def trickle_meter(monkeypatch):
+    monkeypatch.setattr(keithley, 'Serial', TrickleSerial)
+    return Keithley(comm='COM1', timeout=0.3)
+
+def test_reply_is_bounded_by_the_deadline(trickle_meter):
+    start = time.monotonic()
+    with pytest.raises(KeithleyTimeout):
+        trickle_meter.channel[1].getVoltageDC()
+    assert time.monotonic() - start < 0.4
+    assert trickle_meter.last_rtt < 0.4
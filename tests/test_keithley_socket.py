@@ -0,0 +1,93 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from keithley import Keithley, KeithleyNoConnection, KeithleyTimeout
+from keithley_sim import FakeKeithleySCPI, FakeKeithleySocketServer
+
+@pytest.fixture
+def socket_meter():
+    server = FakeKeithleySocketServer()
+    host, port = server.start()
+    keithley = Keithley(tcp='%s:%d' % (host, port))
+    yield server, keithley
+    keithley.close()
+    server.stop()
+
+def test_single_channel_readings(socket_meter):
+    server, keithley = socket_meter
+    assert keithley.channel[4].getVoltageDC() == pytest.approx(1.4)
+    assert keithley.channel[15].getTemperature() == pytest.approx(21.5)
+
+def test_query_many_is_answered_in_order(socket_meter):
+    server, keithley = socket_meter
+    replies = keithley.queryMany(['*IDN?', 'MEAS:VOLT:DC? (@101)', 'MEAS:TEMP? (@102)'])
+    assert replies[0].startswith('KEITHLEY')
+    assert replies[1:] == ['+1.100000E+00VDC', '+2.020000E+01C']
+
+def test_scan_keeps_to_one_connection(socket_meter):
+    server, keithley = socket_meter
+    keithley.configureScan(vdc_channels=[1, 3], temp_channels=[10])
+    for _ in range(5):
+        assert keithley.readScan() == pytest.approx({1: 1.1, 3: 1.3, 10: 21.0})
+    assert server.connections == 1
+    assert server.refused == 0
+
+def test_read_scan_async_keeps_to_one_connection(socket_meter):
+    server, keithley = socket_meter
+
+    async def read(executor):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, keithley.configureScan, [1, 2])
+        return [await keithley.readScanAsync(executor) for _ in range(3)]
+
+    with ThreadPoolExecutor(2) as executor:
+        scans = asyncio.run(read(executor))
+    assert scans == [pytest.approx({1: 1.1, 2: 1.2})] * 3
+    assert server.connections == 1
+    assert server.refused == 0
+
+def test_second_client_is_refused(socket_meter):
+    server, keithley = socket_meter
+    assert keithley.channel[1].getVoltageDC() == pytest.approx(1.1)
+    other = Keithley(tcp='%s:%d' % server.server_address, timeout=2.0)
+    with pytest.raises(KeithleyNoConnection):
+        other.channel[1].getVoltageDC()
+    other.close()
+    assert server.refused >= 1
+    assert keithley.channel[1].getVoltageDC() == pytest.approx(1.1)
+
+def test_scan_timeout_allows_for_every_channel():
+    server = FakeKeithleySocketServer(FakeKeithleySCPI(reading_time=0.03))
+    keithley = Keithley(tcp='%s:%d' % server.start(), timeout=0.2)
+    try:
+        # Twelve readings take 0.36 s, well over the 0.2 s query timeout.
+        keithley.configureScan(vdc_channels=range(1, 13))
+        assert len(keithley.readScan()) == 12
+        with pytest.raises(KeithleyTimeout):
+            keithley.readScan(timeout=0.2)
+    finally:
+        keithley.close()
+        server.stop()
+
+def test_failed_configuration_is_sent_again(socket_meter, monkeypatch):
+    server, keithley = socket_meter
+    keithley.configureScan(vdc_channels=[1])
+    write = keithley._write
+
+    def failing_write(cmd):
+        if cmd.startswith('ROUTe:SCAN '):
+            raise KeithleyNoConnection
+        write(cmd)
+    monkeypatch.setattr(keithley, '_write', failing_write)
+    with pytest.raises(KeithleyNoConnection):
+        keithley.configureScan(vdc_channels=[2])
+    monkeypatch.undo()
+
+    keithley.queryMany(['*IDN?'])
+    commands = server.scpi.commands
+    keithley.configureScan(vdc_channels=[1])
+    assert keithley.readScan() == pytest.approx({1: 1.1})
+    assert server.scpi.commands - commands > 1
+    assert server.scpi.scan == [1]
@@ -0,0 +1,74 @@
+from logwriter import CsvLogWriter
+from samplestore import SampleStore
+
+COLUMNS = [('Timestamp', 'Unix'), ('SN1', 'A'), ('SN1', 'B')]
+
+def write_rows(path, count, columns=COLUMNS, start=0):
+    store = SampleStore(columns, {column: 'int64' for column in columns[1:]})
+    writer = CsvLogWriter(str(path), columns)
+    for i in range(start, start + count):
+        store.append({columns[0]: 100.0 + i, columns[1]: i})
+    writer.write_store(store)
+    writer.close()
+    return writer
+
+def read_rows(path):
+    with open(path) as f:
+        lines = f.read().splitlines()
+    return lines[:2], [line.split(',') for line in lines[2:]]
+
+def test_header_and_rows(tmp_path):
+    path = tmp_path / 'log.csv'
+    write_rows(path, 3)
+    header, rows = read_rows(path)
+    assert header == [',Timestamp,SN1,SN1', ',Unix,A,B']
+    assert [row[0] for row in rows] == ['1', '2', '3']
+    assert rows[0][1:] == ['100.0', '0', '']   # B was never read
+
+def test_resume_carries_row_numbers_on(tmp_path):
+    path = tmp_path / 'log.csv'
+    write_rows(path, 3)
+    writer = write_rows(path, 2, start=3)
+    assert writer.path == str(path)
+    header, rows = read_rows(path)
+    assert header == [',Timestamp,SN1,SN1', ',Unix,A,B']
+    assert [row[0] for row in rows] == ['1', '2', '3', '4', '5']
+    assert [row[2] for row in rows] == ['0', '1', '2', '3', '4']
+
+def test_different_columns_go_to_a_new_file(tmp_path, capsys):
+    path = tmp_path / 'log.csv'
+    write_rows(path, 2)
+    before = path.read_text()
+    other = COLUMNS[:2] + [('SN2', 'A')]
+    writer = write_rows(path, 1, other)
+    assert writer.path == str(tmp_path / 'log-1.csv')
+    assert 'logging to' in capsys.readouterr().err
+    assert path.read_text() == before
+
+    # The same columns again resume the first file that has them.
+    assert write_rows(path, 1, other).path == str(tmp_path / 'log-1.csv')
+    assert write_rows(path, 1, [COLUMNS[0], ('SN3', 'A')]).path == str(tmp_path / 'log-2.csv')
+    header, rows = read_rows(tmp_path / 'log-1.csv')
+    assert header == [',Timestamp,SN1,SN2', ',Unix,A,A']
+    assert [row[0] for row in rows] == ['1', '2']
+
+def test_torn_row_keeps_its_number(tmp_path):
+    path = tmp_path / 'log.csv'
+    write_rows(path, 6)
+    with open(path, 'a') as f:
+        f.write('7,106.0,')   # the run died while writing row 7
+    write_rows(path, 2, start=7)
+    header, rows = read_rows(path)
+    numbers = [row[0] for row in rows]
+    assert numbers == ['1', '2', '3', '4', '5', '6', '7', '8', '9']
+    assert rows[6] == ['7', '106.0', '']
+    assert rows[7][1] == '107.0'
+
+def test_torn_row_number(tmp_path):
+    path = tmp_path / 'log.csv'
+    write_rows(path, 11)
+    with open(path, 'a') as f:
+        f.write('1')   # cut off inside '12'
+    write_rows(path, 1, start=12)
+    header, rows = read_rows(path)
+    assert [row[0] for row in rows][-2:] == ['1', '13']
@@ -0,0 +1,54 @@
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+import thermallogger as tl
+from metrics import CONTENT_TYPE, AcquisitionMetrics, MetricsServer, format_metrics
+
+@pytest.fixture
+def metrics(instances):
+    metrics = AcquisitionMetrics()
+    metrics.instances = instances
+    metrics.store = tl.build_store(metrics.instances)
+    return metrics
+
+@pytest.fixture
+def server(metrics):
+    server = MetricsServer(metrics.collect)
+    yield server
+    server.stop()
+
+def scrape(address, path='/metrics'):
+    with urlopen('http://%s:%d%s' % (address + (path,)), timeout=5) as response:
+        return response.headers['Content-Type'], response.read().decode('utf-8')
+
+def test_serves_on_localhost(server, metrics):
+    host, port = server.start()
+    assert host == '127.0.0.1'
+    assert port != 0
+
+    metrics.instances['SN0']['errors'] = 2
+    metrics.instances['SN1']['handle'] = None
+    content_type, text = scrape((host, port))
+    assert content_type == CONTENT_TYPE
+    lines = text.splitlines()
+    assert '# TYPE thermallogger_uptime_seconds gauge' in lines
+    assert 'thermallogger_adapter_errors_total{adapter="SN0",kind="short_read"} 2.0' in lines
+    assert 'thermallogger_adapter_attached{adapter="SN0"} 1.0' in lines
+    assert 'thermallogger_adapter_attached{adapter="SN1"} 0.0' in lines
+    assert 'thermallogger_queue_depth{queue="store"} 0.0' in lines
+    # No row stored yet, so there is no sample age to report.
+    assert not any(line.startswith('thermallogger_last_sample_age_seconds ') for line in lines)
+
+def test_root_is_metrics_and_others_are_not_found(server):
+    address = server.start()
+    for path in ('/', '/metrics?x=1'):
+        assert 'thermallogger_uptime_seconds ' in scrape(address, path)[1]
+    with pytest.raises(HTTPError) as error:
+        scrape(address, '/other')
+    assert error.value.code == 404
+
+def test_format_metrics_escapes_labels():
+    text = format_metrics([('m', 'gauge', 'Help.', [({'device': 'a"b\\c\nd'}, 1), ({}, None)])])
+    assert text == '# HELP m Help.\n# TYPE m gauge\nm{device="a\\"b\\\\c\\nd"} 1.0\n'
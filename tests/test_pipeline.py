@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from aardvark import aardvark_py3 as aa
+from aardvark.simulator import SimulatedAardvarkApi, SimulatedAdapter, SimulatedDevice
+from aardvark.wrapper import AardvarkI2CPipeline, I2CTransaction
+
+SETTLE_MS = 20
+DELAY_MS = 25
+
+@pytest.fixture
+def bus():
+    """Two devices on one adapter; records every write and read."""
+    devices = [SimulatedDevice(0x2B, {0xE200: 111, 0xE204: 222}, SETTLE_MS),
+               SimulatedDevice(0x2C, {0xE200: 333}, SETTLE_MS)]
+    api = SimulatedAardvarkApi([SimulatedAdapter(2237000000, devices)], usb_latency_ms=0)
+    api.log = []
+    write, read = api.c_aa_i2c_write, api.c_aa_i2c_read
+
+    def logged_write(aardvark, slave_addr, flags, num_bytes, data_out):
+        api.log.append(('write', slave_addr, bytes(data_out)[2], time.monotonic()))
+        return write(aardvark, slave_addr, flags, num_bytes, data_out)
+
+    def logged_read(aardvark, slave_addr, flags, num_bytes, data_in):
+        api.log.append(('read', slave_addr, None, time.monotonic()))
+        return read(aardvark, slave_addr, flags, num_bytes, data_in)
+    api.c_aa_i2c_write, api.c_aa_i2c_read = logged_write, logged_read
+    previous = aa.aa_set_backend(api)
+    yield api, aa.aa_open(0)
+    aa.aa_set_backend(previous)
+
+def tlm(address, code, delay=DELAY_MS):
+    return I2CTransaction(address, 0x10, code, delay=delay, bytes_to_read=2,
+                          name='%x/%x' % (address, code))
+
+def test_results_in_order_given(bus):
+    api, handle = bus
+    results = AardvarkI2CPipeline(handle, [tlm(0x2B, 0xE200), tlm(0x2C, 0xE200),
+                                           tlm(0x2B, 0xE204)])
+    assert [int.from_bytes(bytes(data), 'big') for data, _, _ in results] == [111, 333, 222]
+    assert [(read, written) for _, read, written in results] == [(2, 3)] * 3
+
+def test_delays_overlap_across_addresses_only(bus):
+    api, handle = bus
+    start = time.monotonic()
+    AardvarkI2CPipeline(handle, [tlm(0x2B, 0xE200), tlm(0x2B, 0xE204), tlm(0x2C, 0xE200)])
+    elapsed = time.monotonic() - start
+    events = [(kind, address, code) for kind, address, code, _ in api.log]
+    assert events == [('write', 0x2B, 0x00), ('write', 0x2C, 0x00), ('read', 0x2B, None),
+                      ('write', 0x2B, 0x04), ('read', 0x2C, None), ('read', 0x2B, None)]
+    # Every read waits out its own delay after its own write...
+    writes = {}
+    for kind, address, code, at in api.log:
+        if kind == 'write':
+            writes[address] = at
+        else:
+            assert at - writes[address] >= DELAY_MS / 1000.0
+    # ...but 0x2C settles while 0x2B does: two delays, not three.
+    assert elapsed < 3 * DELAY_MS / 1000.0
+
+def test_delay_shorter_than_settle_is_nacked(bus):
+    api, handle = bus
+    results = AardvarkI2CPipeline(handle, [tlm(0x2B, 0xE200, delay=SETTLE_MS // 4),
+                                           tlm(0x2C, 0xE200)])
+    assert [read for _, read, _ in results] == [0, 2]
@@ -0,0 +1,76 @@
+import json
+
+import rig
+import thermallogger as tl
+from rig import PlanCache
+
+def counting(build):
+    def counted(config):
+        counted.calls += 1
+        return build(config)
+    counted.calls = 0
+    return counted
+
+def test_hit_after_save(device_config, tmp_path):
+    path = str(tmp_path / 'plans.json')
+    build = counting(tl.compile_plan)
+    cache = PlanCache(path)
+    plan = cache.get(device_config, build)
+    assert cache.get(device_config, build) is plan
+    cache.save()
+
+    reloaded = PlanCache(path)
+    assert reloaded.get(device_config, build) == plan
+    assert build.calls == 1
+
+def test_changed_config_misses_and_old_plan_is_dropped(device_config, tmp_path):
+    path = str(tmp_path / 'plans.json')
+    cache = PlanCache(path)
+    cache.get(device_config, tl.compile_plan)
+    cache.save()
+
+    with open(device_config) as f:
+        config = json.load(f)
+    config['devices']['EPS']['TLE codes']['NEW'] = '0xE240'
+    with open(device_config, 'w') as f:
+        json.dump(config, f)
+    build = counting(tl.compile_plan)
+    cache = PlanCache(path)
+    plan = cache.get(device_config, build)
+    assert build.calls == 1
+    assert plan['transactions'][-1]['name'] == 'NEW'
+    cache.save()
+    with open(path) as f:
+        assert list(json.load(f)['plans']) == [rig.config_hash(device_config)]
+
+def test_version_bump_and_bad_file_are_rebuilt(device_config, tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / 'plans.json')
+    cache = PlanCache(path)
+    cache.get(device_config, tl.compile_plan)
+    cache.save()
+
+    monkeypatch.setattr(rig, 'PLAN_VERSION', rig.PLAN_VERSION + 1)
+    build = counting(tl.compile_plan)
+    PlanCache(path).get(device_config, build)
+    assert build.calls == 1
+
+    with open(path, 'w') as f:
+        f.write('{not json')
+    PlanCache(path).get(device_config, build)
+    assert build.calls == 2
+    assert 'ignoring plan cache' in capsys.readouterr().err
+
+def test_cached_plan_builds_the_same_instance(device_config, tmp_path):
+    path = str(tmp_path / 'plans.json')
+    entry = {'config': device_config, 'keithley channels': [1]}
+    cache = PlanCache(path)
+    first = tl.create_instance(entry, 0, 1, plan_cache=cache)
+    cache.save()
+    second = tl.create_instance(entry, 0, 1, plan_cache=PlanCache(path))
+    assert [t.fields() for t in second['Transactions']] == \
+        [t.fields() for t in first['Transactions']]
+    temp = {t.name: t for t in second['Transactions']}
+    assert temp['TEMP'].signed and temp['FLAGS'].endian == 'little'
+    assert temp['COUNT'].bytes_to_read == 4
+    assert second['conversions']['VPCM3V3'](3650) == first['conversions']['VPCM3V3'](3650)
+    assert second['conversions']['VPCM3V3'].unit == 'V'
@@ -0,0 +1,49 @@
+import pytest
+
+from scheduler import MultiRateScheduler, parse_rate
+
+def test_parse_rate():
+    assert parse_rate('0xE200') == {}
+    assert parse_rate({'code': '0xE200', 'period': '2.5'}) == {'period': 2.5}
+    assert parse_rate({'code': '0xE200', 'decimation': 3}) == {'decimation': 3}
+
+def test_due_sets():
+    scheduler = MultiRateScheduler({'fast': {'period': 1}, 'slow': {'period': 3},
+                                    'default': {}, 'every other': {'decimation': 2}},
+                                   default_period=6)
+    assert scheduler.base_period == 1
+    due = [set(scheduler.due(['fast', 'slow', 'default', 'every other'], tick))
+           for tick in range(13)]
+    assert due[0] == {'fast', 'slow', 'default', 'every other'}
+    assert due[1] == due[2] == {'fast'}
+    assert due[3] == due[9] == {'fast', 'slow'}
+    assert due[6] == {'fast', 'slow', 'default'}
+    assert due[12] == {'fast', 'slow', 'default', 'every other'}
+    assert scheduler.is_due('unknown', 5)
+
+def test_decimation_counts_default_periods():
+    rates = {'decimated': {'decimation': 3}, 'default': {}}
+    alone = MultiRateScheduler(rates, default_period=10)
+    with_fast = MultiRateScheduler(dict(rates, fast={'period': 2}), default_period=10)
+    assert alone.decimation['decimated'] * alone.base_period == 30
+    assert with_fast.decimation['decimated'] * with_fast.base_period == 30
+    assert with_fast.decimation == {'decimated': 15, 'default': 5, 'fast': 1}
+
+def test_rounded_periods_are_reported():
+    reports = []
+    scheduler = MultiRateScheduler({'a': {'period': 4}, 'b': {'period': 7}, 'c': {}, 'd': {}},
+                                   default_period=10,
+                                   on_rounded=lambda *report: reports.append(report))
+    assert scheduler.decimation == {'a': 1, 'b': 2, 'c': 2, 'd': 2}
+    assert sorted(reports) == [(7, 8, ['b']), (10, 8, ['c', 'd'])]
+
+def test_rounding_is_printed(capsys):
+    MultiRateScheduler({'a': {'period': 4}, 'b': {'period': 12}}, default_period=8)
+    assert capsys.readouterr().err == ''
+    MultiRateScheduler({'a': {'period': 4}, 'b': {'period': 7}}, default_period=8)
+    assert '7 s is not a multiple of the 4 s tick' in capsys.readouterr().err
+
+@pytest.mark.parametrize('period', [0.1, 0.3, 0.7])
+def test_float_periods_are_not_reported(period, capsys):
+    MultiRateScheduler({'a': {'period': 0.1}, 'b': {'period': period}}, default_period=1.0)
+    assert capsys.readouterr().err == ''
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import thermallogger as tl
+from aardvark import aardvark_py3 as aa
+from aardvark.simulator import SimulatedAardvarkApi
+from conftest import DEVICE_CONFIG, make_sim_api, open_instances
+
+EXPECTED = {'VPCM3V3': 3650, 'IPCM3V3': 12, 'TEMP': -40, 'COUNT': 70000, 'FLAGS': 0x0201}
+
+def polled(instances):
+    return {serial: {name: value for (_, name), value in
+                     tl.poll_instance(serial, instance).items()}
+            for serial, instance in instances.items()}
+
+def test_backend_from_environment(device_config, monkeypatch):
+    monkeypatch.setenv('AARDVARK_BACKEND', 'sim')
+    monkeypatch.setenv('AARDVARK_SIM_CONFIG', device_config)
+    monkeypatch.setenv('AARDVARK_SIM_ADAPTERS', '3')
+    monkeypatch.setenv('AARDVARK_SIM_USB_MS', '0')
+    monkeypatch.setattr(aa, '_backend', None)
+    previous = aa.aa_set_backend(aa._LazyApi())
+    try:
+        assert tl.create_aardvark_list() == {0: 2237000000, 1: 2237000001, 2: 2237000002}
+        assert isinstance(aa._backend, SimulatedAardvarkApi)
+    finally:
+        aa.aa_set_backend(previous)
+
+def test_poll_decodes_register_values(instances):
+    assert len(instances) == 2
+    for row in polled(instances).values():
+        assert row == EXPECTED
+    assert all(instance['errors'] == 0 for instance in instances.values())
+
+def test_repeated_start(device_config, tmp_path):
+    config = json.loads(json.dumps(DEVICE_CONFIG))
+    config['devices']['EPS']['Repeated start'] = True
+    path = tmp_path / 'repeated start.json'
+    path.write_text(json.dumps(config))
+    previous = aa.aa_set_backend(make_sim_api(str(path)))
+    try:
+        instances = open_instances(str(path))
+        calls = aa.api.calls
+        assert polled(instances) == {'SN0': EXPECTED}
+        # One combined write/read per telemetry item.
+        assert aa.api.calls - calls == len(EXPECTED)
+    finally:
+        aa.aa_set_backend(previous)
+
+def test_nacked_reads_are_not_logged(device_config):
+    previous = aa.aa_set_backend(make_sim_api(device_config, nack_rate=1.0))
+    try:
+        instances = open_instances(device_config)
+        assert polled(instances) == {'SN0': {}}
+        assert instances['SN0']['errors'] == len(EXPECTED)
+    finally:
+        aa.aa_set_backend(previous)
+
+def test_unplugged_adapter_disappears(sim_api):
+    assert len(tl.create_aardvark_list()) == 2
+    adapter = sim_api.unplug(2237000000)
+    assert tl.create_aardvark_list() == {0: 2237000001}
+    sim_api.plug(adapter)
+    assert len(tl.create_aardvark_list()) == 2
+
+@pytest.mark.parametrize('n_bytes, expected', [(None, 2), (2, 2), (50, 2), (-1, 0)])
+def test_read_into_clamps_to_buffer(sim_api, n_bytes, expected):
+    handle = aa.aa_open(0)
+    assert aa.aa_i2c_write_from(handle, 0x2B, aa.AA_I2C_NO_FLAGS, bytes([0x10, 0xE2, 0x00])) == 3
+    buffer = bytearray(2)
+    aa.aa_sleep_ms(1)
+    assert aa.aa_i2c_read_into(handle, 0x2B, aa.AA_I2C_NO_FLAGS, buffer, n_bytes) == expected
+    if expected:
+        assert int.from_bytes(buffer, 'big') == EXPECTED['VPCM3V3']
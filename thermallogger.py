@@ -1,14 +1,30 @@
+import argparse
+import asyncio
 import json
+import os
+import signal
 import sys
 import time
-import pandas as pd
-from aardvark.aardvark_py3 import (aa_find_devices_ext,
+from concurrent.futures import ThreadPoolExecutor
+from aardvark.aardvark_py3 import (AardvarkLibraryError, aa_find_devices_ext,
                                    AA_PORT_NOT_FREE,
                                    aa_open, aa_i2c_pullup,
                                    AA_I2C_PULLUP_BOTH)
 
-from aardvark.wrapper import AardvarkI2CWriteRead
+from aardvark.wrapper import AardvarkI2CWriteRead, AardvarkI2CBatch, I2CTransaction
+from aardvark.calibrate import (apply_calibration, calibrate, load_calibration,
+                                save_calibration)
 from keithley import Keithley, KeithleyNoConnection, KeithleyBadData
+from logwriter import ArrowLogWriter, CsvLogWriter, EventLogWriter
+from engine import AcquisitionEngine
+from scheduler import MultiRateScheduler, parse_rate, DEFAULT_PERIOD
+from instrumentation import Instrumentation
+from metrics import AcquisitionMetrics, MetricsServer
+
+TEMPERATURE_CHANNELS = [19, 20]
+TIMESTAMP_COLUMN = ('Timestamp', 'Unix')
+KEITHLEY = 'Keithley'
+KEITHLEY_STATUS_COLUMN = (KEITHLEY, 'status')
 
 def create_aardvark_list():
 
@@ -27,21 +43,27 @@ def create_aardvark_list():
 
         if inuse == "(avail)":
             aardvark_list.update({port:unique_id})
+        else:
+            print('adapter %s on port %d is in use, skipping it' % (unique_id, port),
+                  file=sys.stderr)
 
     return aardvark_list
 
-def create_single_transaction(address, tlm, name):
-    transaction = {
-        'address' : address,
-        'cmd' : 0x10, # get tlm command
-        'data' : tlm,
-        'delay' : 25,
-        'bytes_to_read' : 2,
-        'name' : name
-    }
+def create_single_transaction(address, tlm, name, **options):
+    transaction = I2CTransaction(
+        address = address,
+        cmd = 0x10, # get tlm command
+        data = tlm,
+        delay = 25,
+        bytes_to_read = options.pop('bytes_to_read', 2),
+        name = name,
+        **options
+    )
     return transaction
 
 def generate_transactions(config):
+    from decode import parse_format
+
     config = json.load(open(config))
     transaction_number = 1
     all_transactions = {}
@@ -49,9 +71,15 @@ def generate_transactions(config):
     for device in devices:
         device_transactions = {}
         address = int(devices[device]['Address'], 16)
+        firmware = devices[device].get('Firmware', 'unknown')
+        repeated_start = devices[device].get('Repeated start', False)
         tlm_cmds_list = devices[device]['TLE codes']
         for name, value in tlm_cmds_list.items():
-            transaction = create_single_transaction(address, int(value, 16), name)
+            code = value['code'] if isinstance(value, dict) else value
+            transaction = create_single_transaction(address, int(code, 16), name,
+                                                    device=device, firmware=firmware,
+                                                    repeated_start=repeated_start,
+                                                    **parse_rate(value), **parse_format(value))
             device_transactions.update({('transaction' + str(transaction_number)) :transaction})
             transaction_number = transaction_number + 1
 
@@ -59,105 +87,626 @@ def generate_transactions(config):
 
     return all_transactions
 
+def load_keithley_rates(config):
+    config = json.load(open(config))
+    channels = config.get('Keithley channels', {})
+    return {int(channel): parse_rate(entry) for channel, entry in channels.items()}
+
 def open_aardvark(port):
     handle = aa_open(port)
     aa_i2c_pullup(handle, AA_I2C_PULLUP_BOTH)
     return handle
 
-def create_instances(aardvark_list):
+def prompt_adapter(unique_id):
+    serial_number = input('what is the serial number for the product attached to ' + str(unique_id))
+    config = input('what config?')
+    keithley_channels_string = input('What channels are connected to this product e.g 1 2 3 5')
+    return {'serial': serial_number, 'config': config,
+            'keithley channels': list(map(int, keithley_channels_string.split()))}
+
+def compile_plan(config):
+    # Everything an instance takes from its device config, as plain JSON
+    # data so rig.PlanCache can keep it between runs.
+    from conversions import conversion_settings
+
+    return {
+        'transactions': [t.fields() for t in generate_transactions(config).values()],
+        'keithley rates': {str(channel): rate
+                           for channel, rate in load_keithley_rates(config).items()},
+        'conversions': conversion_settings(config),
+    }
+
+def create_instance(entry, port, unique_id, handle=None, calibration=None, plan_cache=None):
+    from conversions import Conversion
+
+    config = entry['config']
+    if plan_cache is None:
+        plan = compile_plan(config)
+    else:
+        plan = plan_cache.get(config, compile_plan)
+    transaction_list = [I2CTransaction(**fields) for fields in plan['transactions']]
+    if calibration:
+        transaction_list = apply_calibration(transaction_list, calibration)
+    return {
+        "handle": handle,
+        "port": port,
+        "unique id": unique_id,
+        "config": config,
+        "Transactions": transaction_list,
+        "keithley channels": entry['keithley channels'],
+        "keithley rates": {int(channel): rate
+                           for channel, rate in plan['keithley rates'].items()},
+        "conversions": {name: Conversion(**settings)
+                        for name, settings in plan['conversions'].items()},
+        "deadline": entry.get('deadline'),
+        "errors": 0
+    }
+
+def create_instances(aardvark_list, open_handles=True, calibration=None, manifest=None,
+                     plan_cache=None, include_missing=False):
+    # Adapters are described by the rig manifest when there is one (those
+    # it does not list are left alone), otherwise by prompting for each.
+    # With include_missing, manifest adapters that were not found get an
+    # instance with no handle, so they have columns if they attach later.
+    from rig import manifest_entry, missing_adapters
+
     instances = {}
     for port, unique_id in aardvark_list.items():
-        serial_number = input('what is the serial number for the product attached to ' + str(unique_id))
-        config = input('what config?')
-        transaction_list = list(generate_transactions(config).values())
-        handle = open_aardvark(port)
-        keithley_channels_string = input('What channels are connected to this product e.g 1 2 3 5')
-        keithley_channels = map(int, keithley_channels_string.split())
-        instance = {serial_number:{
-            "handle": handle,
-            "Transactions": transaction_list,
-            "keithley channels": keithley_channels
-        }}
-        instances.update(instance)
+        if manifest is None:
+            entry = prompt_adapter(unique_id)
+        else:
+            entry = manifest_entry(manifest, unique_id)
+            if entry is None:
+                print('adapter %s is not in the rig manifest, skipping it' % unique_id,
+                      file=sys.stderr)
+                continue
+        handle = open_aardvark(port) if open_handles else None
+        instances[entry['serial']] = create_instance(entry, port, unique_id, handle,
+                                                     calibration, plan_cache)
+
+    if manifest is not None and include_missing:
+        for unique_id in missing_adapters(manifest, aardvark_list):
+            entry = manifest_entry(manifest, unique_id)
+            instances[entry['serial']] = create_instance(entry, None, None, None,
+                                                         calibration, plan_cache)
 
     return instances
 
-def build_df(instance_list):
-    column_list = []
-    temperature_channels  = [19, 20]
+def open_keithley(manifest=None):
+    if manifest is not None and manifest.get('keithley'):
+        return Keithley(**manifest['keithley'])
+    keithley_comm = input('com')
+    return Keithley(comm=keithley_comm)
+
+def load_rig(args, aardvark_list):
+    # Returns (manifest, plan_cache); each is None when not configured. The
+    # plan cache defaults to '<manifest> plans.json' beside the manifest and
+    # is only used with --rig unless --plan-cache names one.
+    from rig import PlanCache, load_manifest, missing_adapters
+
+    manifest = None
+    plan_cache_path = args.plan_cache
+    if args.rig:
+        manifest = load_manifest(args.rig)
+        for unique_id in missing_adapters(manifest, aardvark_list):
+            print('adapter %s from the rig manifest was not found' % unique_id, file=sys.stderr)
+        if plan_cache_path is None:
+            plan_cache_path = os.path.splitext(args.rig)[0] + ' plans.json'
+    plan_cache = PlanCache(plan_cache_path) if plan_cache_path else None
+    return manifest, plan_cache
+
+def configure_keithley_scan(keithley, instance_list, scheduler=None, tick=0):
+    # Returns False when no Keithley channel is due on this tick.
+    vdc_channels = []
+    temp_channels = []
+    for instance in instance_list:
+        for channel in instance_list[instance]['keithley channels']:
+            if scheduler is None or scheduler.is_due((str(instance), str(channel)), tick):
+                vdc_channels.append(channel)
+
+    for channel in TEMPERATURE_CHANNELS:
+        if scheduler is None or scheduler.is_due(('Temperature', str(channel)), tick):
+            temp_channels.append(channel)
+
+    if not vdc_channels and not temp_channels:
+        return False
+    keithley.configureScan(vdc_channels, temp_channels)
+    return True
+
+def build_scheduler(instance_list, default_period=DEFAULT_PERIOD):
+    rates = {}
+    for instance in instance_list:
+        serial_number = str(instance)
+        keithley_rates = instance_list[instance].get('keithley rates', {})
+        for transaction in instance_list[instance]["Transactions"]:
+            rates[(serial_number, transaction.name)] = parse_rate(
+                {'period': transaction.period, 'decimation': transaction.decimation})
+        for channel in instance_list[instance]['keithley channels']:
+            rates[(serial_number, str(channel))] = keithley_rates.get(channel, {})
+        for channel in TEMPERATURE_CHANNELS:
+            if channel in keithley_rates:
+                rates[('Temperature', str(channel))] = keithley_rates[channel]
+
+    for channel in TEMPERATURE_CHANNELS:
+        rates.setdefault(('Temperature', str(channel)), {})
+
+    return MultiRateScheduler(rates, default_period)
+
+def build_columns(instance_list, status=False):
+    # With status, each adapter and the Keithley get a status column (see
+    # breaker) for the guarded cycle to fill in.
+    from decode import column_dtype
+
+    column_list = [TIMESTAMP_COLUMN]
+    dtypes = {}
+    temperature_channels  = TEMPERATURE_CHANNELS
     for instance in instance_list:
         serial_number = str(instance)
         transaction_list = instance_list[instance]["Transactions"]
         keithley_channel_list = instance_list[instance]['keithley channels']
         for transaction in transaction_list:
-            tlm_name = transaction["name"]
+            tlm_name = transaction.name
             column_name = (serial_number, tlm_name)
             column_list.append(column_name)
+            dtypes[column_name] = column_dtype(transaction)
 
         for channel in keithley_channel_list:
             channel_number = str(channel)
             column_name = (serial_number, channel_number)
             column_list.append(column_name)
 
+        if status:
+            column_list.append((serial_number, 'status'))
+            dtypes[(serial_number, 'status')] = 'int8'
+
     for channel in temperature_channels:
         channel_number = str(channel)
         column_name = ('Temperature', channel_number)
         column_list.append(column_name)
 
-    df = pd.DataFrame(columns=column_list)
-    df.columns = pd.MultiIndex.from_tuples(df.columns)
-    return df
+    if status:
+        column_list.append(KEITHLEY_STATUS_COLUMN)
+        dtypes[KEITHLEY_STATUS_COLUMN] = 'int8'
+
+    return column_list, dtypes
 
-def run_tlm_log(df, instance_list, keithley):
-    ind = len(df) + 1
-    temperature_channels = [19, 20]
+def build_conversions(instance_list):
+    # {(serial number, telemetry name): Conversion} for every converted TLE code.
+    conversions = {}
+    for instance in instance_list:
+        for tlm_name, conversion in instance_list[instance].get('conversions', {}).items():
+            conversions[(str(instance), tlm_name)] = conversion
+    return conversions
+
+def build_store(instance_list, status=False):
+    from samplestore import SampleStore
+
+    column_list, dtypes = build_columns(instance_list, status)
+    return SampleStore(column_list, dtypes)
+
+def due_transactions(serial_number, transactions, scheduler=None, tick=0):
+    if scheduler is None:
+        return list(transactions)
+    return [t for t in transactions if scheduler.is_due((serial_number, t.name), tick)]
+
+def instance_decoder(instance):
+    # Built on first use: the decoder's copies of the transactions read
+    # straight into its cycle buffer, so they are the ones to run.
+    decoder = instance.get('decoder')
+    if decoder is None:
+        from decode import TelemetryDecoder
+
+        decoder = instance['decoder'] = TelemetryDecoder(instance['Transactions'])
+    return decoder
+
+def poll_instance(serial_number, instance, scheduler=None, tick=0):
+    row = {}
+    handle = instance['handle']
+    if handle is None:
+        # Detached: the adapter is missing or was unplugged (see hotplug).
+        return row
+    decoder = instance_decoder(instance)
+    due = due_transactions(serial_number, decoder.transactions, scheduler, tick)
+    results = AardvarkI2CBatch(handle, due)
+    values, valid = decoder.decode(due, results)
+    for transaction, value, ok in zip(decoder.transactions, values.tolist(), valid.tolist()):
+        if ok:
+            row[(serial_number, transaction.name)] = value
+
+    for transaction in due:
+        column_name = (serial_number, transaction.name)
+        if column_name in row:
+            continue
+        try:
+            row[column_name] = retry_word(handle, transaction)
+        except IndexError:
+            instance['errors'] = instance.get('errors', 0) + 1
+
+    return row
+
+def retry_word(handle, transaction):
+    # A failed read with a calibrated delay, or from a repeated-start read
+    # that gave the device no settle time, is retried once as a separate
+    # write and read at the configured worst-case delay. Anything else
+    # raises IndexError straight away.
+    from decode import decode_reply
+
+    if transaction.fallback_delay is None and not transaction.repeated_start:
+        raise IndexError('no retry for %s' % transaction.name)
+
+    retry = transaction.replace(delay=transaction.fallback_delay or transaction.delay,
+                                repeated_start=False)
+    data_read, bytes_read, bytes_written = AardvarkI2CWriteRead(handle, retry)
+    if bytes_written != len(retry.message):
+        raise IndexError('request to %s not written' % transaction.name)
+    return decode_reply(retry, data_read)
+
+def create_executor(instance_list):
+    # One worker per adapter plus one for the Keithley scan. The Aardvark
+    # and serial calls release the GIL while they wait on USB.
+    return ThreadPoolExecutor(max_workers=len(instance_list) + 1,
+                              thread_name_prefix='poll')
+
+def read_keithley(keithley, instance_list, scheduler=None, tick=0):
+    if scheduler is not None and not configure_keithley_scan(keithley, instance_list, scheduler, tick):
+        return {}
+    return keithley.readScan()
+
+async def read_keithley_async(keithley, instance_list, scheduler=None, tick=0, executor=None):
+    # The scan set-up is a dozen blocking writes whenever the due channels
+    # change, so it runs in the executor with the read, never on the loop.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, read_keithley, keithley, instance_list,
+                                      scheduler, tick)
+
+def run_tlm_log(store, instance_list, keithley, executor=None, scheduler=None, tick=0):
+    row = {TIMESTAMP_COLUMN: time.time()}
+    if executor is None:
+        keithley_readings = read_keithley(keithley, instance_list, scheduler, tick)
+        for instance in instance_list:
+            row.update(poll_instance(str(instance), instance_list[instance], scheduler, tick))
+    else:
+        keithley_future = executor.submit(read_keithley, keithley, instance_list, scheduler, tick)
+        instance_futures = [executor.submit(poll_instance, str(instance), instance_list[instance],
+                                            scheduler, tick)
+                            for instance in instance_list]
+        for future in instance_futures:
+            row.update(future.result())
+        keithley_readings = keithley_future.result()
+
+    add_keithley_readings(row, instance_list, keithley_readings)
+    return store.append(row)
+
+async def run_tlm_log_async(store, instance_list, keithley, executor, scheduler=None, tick=0):
+    # Same cycle as run_tlm_log, with each adapter and the Keithley scan in
+    # the executor, awaited together on the event loop.
+    loop = asyncio.get_running_loop()
+    row = {TIMESTAMP_COLUMN: time.time()}
+    polls = [loop.run_in_executor(executor, poll_instance, str(instance), instance_list[instance],
+                                  scheduler, tick)
+             for instance in instance_list]
+    keithley_readings, *rows = await asyncio.gather(
+        read_keithley_async(keithley, instance_list, scheduler, tick, executor), *polls)
+    for instance_row in rows:
+        row.update(instance_row)
+
+    add_keithley_readings(row, instance_list, keithley_readings)
+    return store.append(row)
+
+def build_guards(instance_list, deadline, keithley_deadline, failures=3, backoff=1.0):
+    # One DeviceGuard per adapter, keyed by serial number, and one for the
+    # Keithley. A 'deadline' in an adapter's manifest entry overrides the
+    # default.
+    from breaker import CircuitBreaker, DeviceGuard
+
+    guards = {}
+    for instance in instance_list:
+        guards[str(instance)] = DeviceGuard(instance_list[instance].get('deadline') or deadline,
+                                            CircuitBreaker(failures, backoff))
+    guards[KEITHLEY] = DeviceGuard(keithley_deadline, CircuitBreaker(failures, backoff))
+    return guards
+
+async def run_guarded_log_async(store, instance_list, keithley, executor, guards,
+                                scheduler=None, tick=0):
+    # run_tlm_log_async with a deadline and circuit breaker per adapter and
+    # for the Keithley: a device that fails, runs late or is skipped is left
+    # out of the row, its status column says why, and the others never
+    # wait on it.
+    from breaker import STATUS_DETACHED
+
+    loop = asyncio.get_running_loop()
+    row = {TIMESTAMP_COLUMN: time.time()}
+
+    async def poll(serial_number, instance):
+        guard = guards[serial_number]
+        if instance['handle'] is None:
+            guard.breaker.reset()
+            guard.status = STATUS_DETACHED
+            return None
+        return await guard.run(
+            lambda: loop.run_in_executor(executor, poll_instance, serial_number, instance,
+                                         scheduler, tick),
+            lambda instance_row: instance_row or not due_transactions(
+                serial_number, instance['Transactions'], scheduler, tick))
+
+    keithley_readings, *rows = await asyncio.gather(
+        guards[KEITHLEY].run(lambda: read_keithley_async(keithley, instance_list, scheduler, tick,
+                                                         executor)),
+        *[poll(str(instance), instance_list[instance]) for instance in instance_list])
+    for instance_row in rows:
+        if instance_row:
+            row.update(instance_row)
+
+    add_keithley_readings(row, instance_list, keithley_readings or {})
+    for instance in instance_list:
+        row[(str(instance), 'status')] = guards[str(instance)].status
+    row[KEITHLEY_STATUS_COLUMN] = guards[KEITHLEY].status
+    return store.append(row)
+
+def add_keithley_readings(row, instance_list, keithley_readings):
+    temperature_channels = TEMPERATURE_CHANNELS
     for instance in instance_list:
         serial_number = str(instance)
-        handle = instance_list[instance]['handle']
-        transaction_list = instance_list[instance]["Transactions"]
         keithley_channel_list = instance_list[instance]['keithley channels']
-        for transaction in transaction_list:
-            tlm_name = transaction["name"]
-            column_name = (serial_number, tlm_name)
-            data_read, bytes_read, bytes_written = AardvarkI2CWriteRead(handle, transaction)
-            try:
-                data = byte_to_word(data_read)
-            except IndexError:
-                data = "0"
-            df.set_value(ind, column_name, data)
-
         for channel in keithley_channel_list:
+            if channel not in keithley_readings:
+                continue
             channel_number = str(channel)
             column_name = (serial_number, channel_number)
-            data = keithley.channel[channel_number].getVoltageDC()
-            df.set_value(ind, column_name, data)
+            row[column_name] = keithley_readings[channel]
 
     for channel in temperature_channels:
+        if channel not in keithley_readings:
+            continue
         channel_number = str(channel)
         column_name = ('Temperature', channel_number)
-        data = keithley.channel[channel_number].getTemperature()
-        df.set_value(ind, column_name, data)
+        row[column_name] = keithley_readings[channel]
 
-def byte_to_word(bytes_):
-    return(bytes_[0]<<8 |bytes_[1])
+def run_process_log(store, instance_list, keithley, pool, cycle, sleeptime, scheduler=None):
+    row = {TIMESTAMP_COLUMN: time.time()}
+    keithley_readings = read_keithley(keithley, instance_list, scheduler, cycle)
+    row.update(pool.collect(cycle, sleeptime / 2))
+    add_keithley_readings(row, instance_list, keithley_readings)
+    return store.append(row)
+
+def main_processes(all_instances, store, writer, keithley, scheduler, on_cycle=None,
+                   metrics=None):
+    from adapterprocess import AdapterProcessPool
+
+    sleeptime = scheduler.base_period
+    pool = AdapterProcessPool(all_instances, sleeptime, scheduler)
+    start_time = pool.start()
+    loop_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='collect')
+
+    async def cycle(n):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(loop_executor, run_process_log,
+                                   store, all_instances, keithley, pool, n, sleeptime, scheduler)
+        writer.write_store(store)
+        if on_cycle is not None:
+            on_cycle(n)
+
+    engine = AcquisitionEngine(cycle, sleeptime)
+    if metrics is not None:
+        metrics.engine = engine
+        metrics.pool = pool
+    try:
+        asyncio.run(engine.run(first_delay=max(0, start_time - time.monotonic())))
+    finally:
+        pool.stop()
+        loop_executor.shutdown(wait=False)
+
+def main_threads(all_instances, store, writer, keithley, scheduler, on_cycle=None,
+                 metrics=None, guards=None):
+    executor = create_executor(all_instances)
+
+    async def cycle(n):
+        if guards is None:
+            await run_tlm_log_async(store, all_instances, keithley, executor, scheduler, n)
+        else:
+            await run_guarded_log_async(store, all_instances, keithley, executor, guards,
+                                        scheduler, n)
+        writer.write_store(store)
+        if on_cycle is not None:
+            on_cycle(n)
+
+    engine = AcquisitionEngine(cycle, scheduler.base_period)
+    if metrics is not None:
+        metrics.engine = engine
+        metrics.guards = guards or {}
+    try:
+        asyncio.run(engine.run())
+    finally:
+        executor.shutdown(wait=False)
+
+def dump_histograms(instrumentation, path=None):
+    if path:
+        instrumentation.dump_json(path)
+    else:
+        instrumentation.dump()
+
+def start_instrumentation(args, all_instances):
+    # Returns (instrumentation, on_cycle), both None unless --histograms is
+    # given. In --processes mode the I2C transactions run in the workers,
+    # so only the Keithley and store histograms are recorded here.
+    if args.histograms is None:
+        return None, None
+    instrumentation = Instrumentation().install()
+    for serial_number, instance in all_instances.items():
+        if instance['handle'] is not None:
+            instrumentation.adapter_names[instance['handle']] = serial_number
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: dump_histograms(instrumentation, args.histogram_file))
+
+    def on_cycle(n):
+        if args.histograms and (n + 1) % args.histograms == 0:
+            dump_histograms(instrumentation, args.histogram_file)
+    return instrumentation, on_cycle
+
+def start_metrics(args, all_instances, store, writer, keithley):
+    # Returns (server, metrics), both None unless --metrics-port is given.
+    if args.metrics_port is None:
+        return None, None
+    metrics = AcquisitionMetrics()
+    metrics.instances = all_instances
+    metrics.store = store
+    metrics.writer = writer
+    metrics.keithley = keithley
+    server = MetricsServer(metrics.collect, (args.metrics_host, args.metrics_port))
+    host, port = server.start()
+    print('metrics on http://%s:%d/metrics' % (host, port), file=sys.stderr)
+    return server, metrics
+
+def open_log_writer(args, store, instance_list):
+    # The data log named by --log, 'thing.<format>' by default. An Arrow
+    # stream cannot be appended to, so an existing one is never reused.
+    path = args.log or 'thing.' + args.format
+    conversions = build_conversions(instance_list)
+    if args.format == 'arrow':
+        if os.path.exists(path):
+            sys.exit('%s already exists, choose another --log' % path)
+        options = {} if args.flush_rows is None else {'rows_per_batch': args.flush_rows}
+        return ArrowLogWriter(path, store.columns, store.dtypes, conversions=conversions,
+                              **options)
+    fsync_interval = None if args.fsync_interval < 0 else args.fsync_interval
+    return CsvLogWriter(path, store.columns, args.flush_rows or 1, fsync_interval,
+                        conversions=conversions)
+
+def start_hotplug(args, all_instances, manifest, writer, instrumentation=None, guards=None):
+    # Returns (watcher, events), both None unless --hotplug is given. The
+    # watcher's changes are logged to '<log> events.csv' beside the data.
+    if args.hotplug is None:
+        return None, None
+    from hotplug import AdapterWatcher
+
+    events = EventLogWriter(os.path.splitext(writer.path)[0] + ' events.csv')
+    for serial_number, instance in all_instances.items():
+        if instance['handle'] is None:
+            events.write('detached', serial_number, 'not found at startup')
+
+    def on_event(event, serial_number, instance):
+        detail = 'port %s id %s' % (instance['port'], instance['unique id'])
+        events.write(event, serial_number, detail if event == 'attached' else '')
+        print('adapter %s %s' % (serial_number, event), file=sys.stderr)
+        if instrumentation is not None and event == 'attached':
+            instrumentation.adapter_names[instance['handle']] = serial_number
+
+    watcher = AdapterWatcher(all_instances, manifest, open_aardvark, args.hotplug, on_event,
+                             guards)
+    return watcher.start(), events
+
+def combine_cycle_hooks(*hooks):
+    hooks = [hook for hook in hooks if hook is not None]
+    if not hooks:
+        return None
+
+    def on_cycle(n):
+        for hook in hooks:
+            hook(n)
+    return on_cycle
 
 def main():
+    parser = argparse.ArgumentParser(description='EPS thermal test logger')
+    parser.add_argument('--processes', action='store_true',
+                        help='serve each Aardvark adapter from its own process')
+    parser.add_argument('--log', metavar='PATH',
+                        help="data log to write (default 'thing.csv' or 'thing.arrow')")
+    parser.add_argument('--format', choices=('csv', 'arrow'), default='csv',
+                        help='data log format (arrow needs pyarrow)')
+    parser.add_argument('--flush-rows', type=int, metavar='N',
+                        help='rows buffered before each write (default 1 for csv, '
+                             '60 for arrow)')
+    parser.add_argument('--fsync-interval', type=float, default=0, metavar='SECONDS',
+                        help='least time between fsyncs of the csv log: 0 after every '
+                             'write, negative never')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='measure the shortest settle delay per command and exit')
+    parser.add_argument('--delay-cache', default='delay calibration.json',
+                        help='calibrated settle delays, keyed by device and firmware')
+    parser.add_argument('--histograms', type=int, metavar='N',
+                        help='record latency histograms and dump them every N cycles '
+                             '(0: only on exit or SIGUSR1)')
+    parser.add_argument('--histogram-file',
+                        help='write the histograms here as JSON instead of to stderr')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve live metrics in the Prometheus text format on this port')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='address to serve metrics on (default: localhost only)')
+    parser.add_argument('--rig', metavar='MANIFEST',
+                        help='rig manifest mapping adapters to products, instead of prompting')
+    parser.add_argument('--plan-cache',
+                        help="compiled device plans, keyed by config (default with --rig: "
+                             "'<manifest> plans.json'; '' to disable)")
+    parser.add_argument('--hotplug', type=float, nargs='?', const=2.0, metavar='SECONDS',
+                        help='attach and detach manifest adapters while running, '
+                             'checking every SECONDS (default 2)')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='time each adapter has to answer within a cycle '
+                             '(default 0.8 of the cycle period)')
+    parser.add_argument('--keithley-deadline', type=float, metavar='SECONDS',
+                        help='time the Keithley scan has within a cycle (default as --deadline)')
+    parser.add_argument('--breaker-failures', type=int, default=3, metavar='N',
+                        help='skip a device after N failed cycles in a row')
+    parser.add_argument('--breaker-backoff', type=float, default=1.0, metavar='SECONDS',
+                        help='first wait before probing a skipped device again, doubled '
+                             'after each failed probe')
+    args = parser.parse_args()
+    if args.hotplug is not None and (args.processes or not args.rig):
+        parser.error('--hotplug needs --rig and does not work with --processes')
 
-    aardvark_list = create_aardvark_list()
-    all_instances = create_instances(aardvark_list)
-    df = build_df(all_instances)
-    sleeptime = 10.0
-    keithley_comm = input('com')
-    keithley = Keithley(comm=keithley_comm)
-    while True:
-        try:
-            run_tlm_log(df, all_instances, keithley)
-            start_time = time.time()
-            while True:
-                time.sleep(sleeptime - ((time.time() - start_time) % sleeptime))
-        except KeyboardInterrupt:
-            df.to_csv('thing.csv')
-            sys.exit(0)
+    calibration = load_calibration(args.delay_cache)
+    try:
+        aardvark_list = create_aardvark_list()
+    except AardvarkLibraryError as e:
+        sys.exit(str(e))
+    manifest, plan_cache = load_rig(args, aardvark_list)
+    if args.calibrate:
+        all_instances = create_instances(aardvark_list, manifest=manifest, plan_cache=plan_cache)
+        for instance in all_instances.values():
+            calibrate(instance['handle'], instance['Transactions'], calibration)
+        save_calibration(args.delay_cache, calibration)
+        return
+
+    all_instances = create_instances(aardvark_list, open_handles=not args.processes,
+                                     calibration=calibration, manifest=manifest,
+                                     plan_cache=plan_cache,
+                                     include_missing=args.hotplug is not None)
+    if plan_cache is not None:
+        plan_cache.save()
+    store = build_store(all_instances, status=not args.processes)
+    writer = open_log_writer(args, store, all_instances)
+    scheduler = build_scheduler(all_instances)
+    deadline = args.deadline or 0.8 * scheduler.base_period
+    guards = None if args.processes else build_guards(
+        all_instances, deadline, args.keithley_deadline or deadline,
+        args.breaker_failures, args.breaker_backoff)
+    keithley = open_keithley(manifest)
+    configure_keithley_scan(keithley, all_instances)
+    instrumentation, on_histogram_cycle = start_instrumentation(args, all_instances)
+    metrics_server, metrics = start_metrics(args, all_instances, store, writer, keithley)
+    watcher, events = start_hotplug(args, all_instances, manifest, writer, instrumentation,
+                                    guards)
+    on_cycle = combine_cycle_hooks(metrics and metrics.cycle_done, on_histogram_cycle,
+                                   watcher and watcher.apply)
+    try:
+        if args.processes:
+            main_processes(all_instances, store, writer, keithley, scheduler, on_cycle, metrics)
+        else:
+            main_threads(all_instances, store, writer, keithley, scheduler, on_cycle, metrics,
+                         guards)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        if watcher is not None:
+            watcher.stop()
+            events.close()
+        writer.close()
+        keithley.close()
+        if instrumentation is not None:
+            dump_histograms(instrumentation, args.histogram_file)
 
 if __name__ == "__main__":
     main()